@@ -0,0 +1,244 @@
+"""Build de archivos estáticos y helper de Flask para resolverlos.
+
+    python assets.py            # genera static/dist y static/dist/manifest.json
+
+El build copia CSS, JS, íconos e imágenes con el hash del contenido en el
+nombre, minifica CSS y JS, une las hojas de estilo comunes en css/base.css,
+deja hermanos .gz (y .br si está instalado brotli) y crea miniaturas WebP de
+las imágenes de productos (requiere Pillow). Las plantillas usan
+``asset_url('css/style.css')`` y ``asset_urls('css/base.css')`` para bundles;
+sin manifest se sirven los archivos originales.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from io import BytesIO
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli solo se generan .gz
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+PRODUCTOS_PATH = os.path.join(BASE_DIR, "data", "productos.json")
+
+CARPETAS = ("css", "js", "icon", "img")
+# Hojas que casi todas las páginas cargan juntas y en este orden
+BUNDLES = {
+    "css/base.css": ["css/style.css", "css/output.css", "css/animaciones.css"],
+}
+COMPRIMIBLES = (".css", ".js", ".svg")
+MINIATURA_ANCHO = 320
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+
+# =================== Minificación ===================
+def minificar_css(texto):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(texto)
+    except ImportError:
+        pass
+    texto = re.sub(r"/\*.*?\*/", "", texto, flags=re.S)
+    texto = re.sub(r"\s+", " ", texto)
+    # Solo alrededor de llaves, punto y coma y comas: los espacios antes de ':'
+    # son significativos en selectores (``a :hover``) y en calc() los de +/-
+    texto = re.sub(r"\s*([{};])\s*", r"\1", texto)
+    texto = re.sub(r",\s+", ",", texto)
+    return texto.replace(";}", "}").strip()
+
+
+def minificar_js(texto):
+    try:
+        import rjsmin
+        return rjsmin.jsmin(texto)
+    except ImportError:
+        pass
+    # Conservador: sin un parser no se tocan cadenas ni saltos de línea (ASI)
+    lineas = []
+    for linea in texto.splitlines():
+        linea = linea.strip()
+        if linea and not linea.startswith("//"):
+            lineas.append(linea)
+    return "\n".join(lineas) + "\n"
+
+
+# =================== Build ===================
+def _huella(datos):
+    return hashlib.sha256(datos).hexdigest()[:10]
+
+
+def _nombre_con_hash(nombre, datos, extension=None):
+    raiz, ext = os.path.splitext(nombre)
+    return f"{raiz}.{_huella(datos)}{extension or ext}"
+
+
+def _escribir(ruta_relativa, datos):
+    destino = os.path.join(DIST_DIR, ruta_relativa)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, "wb") as f:
+        f.write(datos)
+    if destino.endswith(COMPRIMIBLES):
+        with open(destino + ".gz", "wb") as f:
+            f.write(gzip.compress(datos, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(destino + ".br", "wb") as f:
+                f.write(brotli.compress(datos, quality=11))
+
+
+def _leer(nombre):
+    with open(os.path.join(STATIC_DIR, nombre), "rb") as f:
+        return f.read()
+
+
+def _procesar(nombre, datos):
+    if nombre.endswith(".css"):
+        return minificar_css(datos.decode("utf-8")).encode("utf-8")
+    if nombre.endswith(".js"):
+        return minificar_js(datos.decode("utf-8")).encode("utf-8")
+    return datos
+
+
+def _miniaturas():
+    """Miniaturas WebP de las imágenes de productos: {imagen: ruta en dist}."""
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow no está instalado: no se generan miniaturas")
+        return {}
+    with open(PRODUCTOS_PATH, encoding="utf-8") as f:
+        imagenes = sorted({p["imagen"] for p in json.load(f) if p.get("imagen")})
+
+    miniaturas = {}
+    for imagen in imagenes:
+        origen = os.path.join(STATIC_DIR, "img", imagen)
+        if not os.path.exists(origen):
+            continue
+        with Image.open(origen) as img:
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            if img.width > MINIATURA_ANCHO:
+                alto = round(img.height * MINIATURA_ANCHO / img.width)
+                img = img.resize((MINIATURA_ANCHO, alto), Image.LANCZOS)
+            buffer = BytesIO()
+            img.save(buffer, "WEBP", quality=80, method=6)
+        datos = buffer.getvalue()
+        ruta = _nombre_con_hash(f"img/miniaturas/{imagen}", datos, ".webp")
+        _escribir(ruta, datos)
+        miniaturas[imagen] = ruta
+    return miniaturas
+
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    archivos = {}
+    for carpeta in CARPETAS:
+        for raiz, _, nombres in os.walk(os.path.join(STATIC_DIR, carpeta)):
+            for nombre in sorted(nombres):
+                relativo = os.path.relpath(os.path.join(raiz, nombre), STATIC_DIR).replace(os.sep, "/")
+                datos = _procesar(relativo, _leer(relativo))
+                archivos[relativo] = _nombre_con_hash(relativo, datos)
+                _escribir(archivos[relativo], datos)
+
+    for bundle, partes in BUNDLES.items():
+        datos = b"\n".join(_procesar(p, _leer(p)) for p in partes)
+        archivos[bundle] = _nombre_con_hash(bundle, datos)
+        _escribir(archivos[bundle], datos)
+
+    manifest = {"archivos": archivos, "miniaturas": _miniaturas()}
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+# =================== Flask ===================
+class Assets:
+    """Resuelve nombres lógicos a los archivos con hash y los sirve en /assets."""
+
+    def __init__(self, app=None, manifest_path=MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self.archivos = {}
+        self.miniaturas = {}
+        self.version = None
+        if app is not None:
+            self.init_app(app)
+
+    def cargar(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                contenido = f.read()
+        except FileNotFoundError:
+            logger.info("Sin manifest de assets: se sirven los archivos originales de /static")
+            return
+        manifest = json.loads(contenido)
+        self.archivos = manifest.get("archivos", {})
+        self.miniaturas = manifest.get("miniaturas", {})
+        self.version = _huella(contenido.encode("utf-8"))
+
+    def init_app(self, app):
+        from flask import request, send_from_directory, url_for
+        from werkzeug.security import safe_join
+
+        self.cargar()
+        self._url_for = url_for
+
+        @app.route("/assets/<path:nombre>")
+        def assets(nombre):
+            # Los nombres llevan el hash del contenido: se pueden cachear para siempre
+            acepta = request.accept_encodings
+            for codificacion, sufijo in (("br", ".br"), ("gzip", ".gz")):
+                comprimido = safe_join(DIST_DIR, nombre + sufijo)
+                if acepta[codificacion] and comprimido and os.path.exists(comprimido):
+                    response = send_from_directory(DIST_DIR, nombre + sufijo, max_age=31536000)
+                    response.headers["Content-Encoding"] = codificacion
+                    response.mimetype = _mimetype(nombre)
+                    break
+            else:
+                response = send_from_directory(DIST_DIR, nombre, max_age=31536000)
+            response.headers["Cache-Control"] = CACHE_INMUTABLE
+            response.vary.add("Accept-Encoding")
+            return response
+
+        app.jinja_env.globals["asset_url"] = self.url
+        app.jinja_env.globals["asset_urls"] = self.urls
+        return app
+
+    def url(self, nombre):
+        construido = self.archivos.get(nombre)
+        if construido is None:
+            # Sin build (desarrollo): el archivo original de /static
+            return self._url_for("static", filename=nombre)
+        return self._url_for("assets", nombre=construido)
+
+    def urls(self, nombre):
+        """URLs de un bundle: una sola tras el build, sus partes sin él."""
+        if nombre in BUNDLES and nombre not in self.archivos:
+            return [self.url(parte) for parte in BUNDLES[nombre]]
+        return [self.url(nombre)]
+
+    def miniatura(self, imagen):
+        """URL de la miniatura WebP de un producto, o None si no se generó."""
+        ruta = self.miniaturas.get(imagen)
+        return self._url_for("assets", nombre=ruta) if ruta else None
+
+
+def _mimetype(nombre):
+    import mimetypes
+    return mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    manifest = build()
+    print(f"✔ {len(manifest['archivos'])} archivos y {len(manifest['miniaturas'])} miniaturas en {DIST_DIR}")
+    sys.exit(0)
@@ -0,0 +1,393 @@
+"""Benchmark de las rutas principales con una base de datos SQLite local.
+
+Reproduce una mezcla de peticiones (login, perfil, crear_pedido,
+descargar_factura, contact) con el cliente de pruebas de Flask o contra un
+servidor WSGI real, y reporta p50/p95/p99, peticiones por segundo y memoria
+asignada por ruta. Cada corrida se agrega a benchmarks/resultados.jsonl con el
+commit actual para comparar entre versiones.
+
+    python benchmark.py --modo cliente --usuarios 8 --peticiones 200
+    python benchmark.py --modo wsgi --comparar
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTADOS = os.path.join(BASE_DIR, "benchmarks", "resultados.jsonl")
+PASSWORD = "bench-password"
+
+# Peso de cada ruta en la mezcla de peticiones
+MEZCLA = {
+    "login": 1,
+    "perfil": 4,
+    "crear_pedido": 1,
+    "descargar_factura": 2,
+    "contact": 1,
+}
+
+
+# =================== Entorno y datos ===================
+def preparar_entorno(directorio):
+    """Apunta la app a archivos locales. Debe llamarse antes de importar app."""
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["DB_SQLITE_PATH"] = os.path.join(directorio, "bench.sqlite3")
+    os.environ["FACTURAS_CACHE_DIR"] = os.path.join(directorio, "facturas")
+    os.environ["COLA_ESCRITURA_PATH"] = os.path.join(directorio, "cola_escritura.sqlite3")
+    os.environ["TAREAS_PATH"] = os.path.join(directorio, "tareas.sqlite3")
+    # Todos los usuarios virtuales salen de la misma IP
+    os.environ["RATE_LIMIT"] = "0"
+
+
+def sembrar(usuarios, pedidos_por_usuario, semilla=1):
+    """Crea el esquema y los datos de prueba.
+
+    Devuelve ({email: [ids de pedidos]}, productos).
+    """
+    from werkzeug.security import generate_password_hash
+
+    import db_sqlite
+    from catalogo import sembrar_productos
+    from pedidos import guardar_items
+
+    rnd = random.Random(semilla)
+    conn = db_sqlite.connect(os.environ["DB_SQLITE_PATH"])
+    db_sqlite.crear_esquema(conn)
+    cursor = conn.cursor(dictionary=True)
+    sembrar_productos(cursor)
+    cursor.execute("SELECT id, nombre, precio FROM productos")
+    productos = cursor.fetchall()
+
+    hash_password = generate_password_hash(PASSWORD)
+    cuentas = {}
+    conn.start_transaction()
+    for n in range(usuarios):
+        email = f"bench{n}@greencrop.test"
+        cursor.execute(
+            "INSERT INTO usuarios (email, telefono, password, puntos) VALUES (%s, %s, %s, %s)",
+            (email, "999999999", hash_password, 0),
+        )
+        usuario_id = cursor.lastrowid
+        cuentas[email] = []
+        for i in range(pedidos_por_usuario):
+            items = [
+                {"producto_id": p["id"], "nombre": p["nombre"], "cantidad": rnd.randint(1, 5), "precio": float(p["precio"])}
+                for p in rnd.sample(productos, rnd.randint(1, 6))
+            ]
+            total = round(sum(i["cantidad"] * i["precio"] for i in items), 2)
+            cursor.execute(
+                "INSERT INTO pedidos (usuario_id, email_cliente, fecha_pedido, total, datos_pedido) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                (usuario_id, email, datetime.now() - timedelta(days=i), total, json.dumps({"items": items})),
+            )
+            pedido_id = cursor.lastrowid
+            guardar_items(cursor, pedido_id, items)
+            cuentas[email].append(pedido_id)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return cuentas, productos
+
+
+# =================== Clientes ===================
+class ClienteFlask:
+    """Peticiones en proceso con app.test_client() (sin red ni servidor)."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def peticion(self, metodo, ruta, datos=None):
+        respuesta = self._cliente.open(ruta, method=metodo, data=datos)
+        respuesta.get_data()
+        respuesta.close()
+        return respuesta.status_code
+
+
+class ClienteHTTP:
+    """Peticiones HTTP reales con keep-alive y cookies de sesión."""
+
+    def __init__(self, host, puerto):
+        self._conn = HTTPConnection(host, puerto, timeout=30)
+        self._cookies = {}
+
+    def peticion(self, metodo, ruta, datos=None):
+        cuerpo = urlencode(datos) if datos else None
+        headers = {"Cookie": "; ".join(f"{k}={v}" for k, v in self._cookies.items())}
+        if cuerpo:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self._conn.request(metodo, ruta, body=cuerpo, headers=headers)
+        respuesta = self._conn.getresponse()
+        respuesta.read()
+        for cabecera in respuesta.headers.get_all("Set-Cookie") or []:
+            nombre, _, valor = cabecera.split(";", 1)[0].partition("=")
+            if valor:
+                self._cookies[nombre.strip()] = valor
+            else:
+                self._cookies.pop(nombre.strip(), None)
+        return respuesta.status
+
+    def cerrar(self):
+        self._conn.close()
+
+
+def servidor_wsgi(app):
+    """Levanta el servidor WSGI de Werkzeug (multi-hilo) en un puerto libre."""
+    from werkzeug.serving import make_server
+
+    servidor = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, name="bench-wsgi", daemon=True).start()
+    return servidor
+
+
+# =================== Escenario ===================
+class UsuarioVirtual:
+    """Un usuario con sesión propia que elige rutas según MEZCLA."""
+
+    def __init__(self, cliente, email, pedidos, productos, rnd):
+        self.cliente = cliente
+        self.email = email
+        self.pedidos = pedidos
+        self.productos = productos
+        self.rnd = rnd
+
+    def login(self):
+        return self.cliente.peticion("POST", "/login", {"email": self.email, "password": PASSWORD})
+
+    def perfil(self):
+        return self.cliente.peticion("GET", "/perfil")
+
+    def crear_pedido(self):
+        items = [
+            {"producto_id": p["id"], "nombre": p["nombre"], "cantidad": self.rnd.randint(1, 3), "precio": float(p["precio"])}
+            for p in self.rnd.sample(self.productos, self.rnd.randint(1, 4))
+        ]
+        total = round(sum(i["cantidad"] * i["precio"] for i in items), 2)
+        return self.cliente.peticion("POST", "/crear_pedido", {
+            "datos_pedido": json.dumps({"items": items}), "total": total,
+        })
+
+    def descargar_factura(self):
+        return self.cliente.peticion("GET", f"/descargar_factura/{self.rnd.choice(self.pedidos)}")
+
+    def contact(self):
+        return self.cliente.peticion("POST", "/contact", {
+            "name": "Bench", "email": self.email, "message": "Consulta de prueba de carga",
+        })
+
+
+def ejecutar_mezcla(usuario, peticiones, metricas, lock):
+    rutas, pesos = zip(*MEZCLA.items())
+    usuario.login()
+    locales = {ruta: [] for ruta in rutas}
+    errores = {ruta: 0 for ruta in rutas}
+    for ruta in usuario.rnd.choices(rutas, weights=pesos, k=peticiones):
+        inicio = time.perf_counter()
+        try:
+            estado = getattr(usuario, ruta)()
+        except Exception:
+            estado = 599
+        locales[ruta].append(time.perf_counter() - inicio)
+        if estado >= 500:
+            errores[ruta] += 1
+    with lock:
+        for ruta in rutas:
+            metricas[ruta]["latencias"] += locales[ruta]
+            metricas[ruta]["errores"] += errores[ruta]
+
+
+def medir_asignaciones(usuario, repeticiones):
+    """KiB de pico asignados por petición, por ruta (secuencial, con tracemalloc)."""
+    usuario.login()
+    resultado = {}
+    tracemalloc.start()
+    try:
+        for ruta in MEZCLA:
+            picos = []
+            for _ in range(repeticiones):
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                getattr(usuario, ruta)()
+                picos.append(tracemalloc.get_traced_memory()[1] - base)
+            resultado[ruta] = round(sum(picos) / len(picos) / 1024, 1)
+    finally:
+        tracemalloc.stop()
+    return resultado
+
+
+def percentil(valores, q):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+
+
+def correr(args):
+    directorio = tempfile.mkdtemp(prefix="bench-greencrop-")
+    preparar_entorno(directorio)
+    cuentas, productos = sembrar(args.usuarios, args.pedidos)
+
+    sys.path.insert(0, BASE_DIR)
+    from app import app
+
+    servidor = servidor_wsgi(app) if args.modo == "wsgi" else None
+
+    def nuevo_cliente():
+        if servidor is None:
+            return ClienteFlask(app)
+        return ClienteHTTP("127.0.0.1", servidor.server_port)
+
+    def nuevo_usuario(n, email):
+        return UsuarioVirtual(nuevo_cliente(), email, cuentas[email], productos, random.Random(args.semilla + n))
+
+    emails = list(cuentas)
+    # Calentamiento: primeras facturas, plantillas y catálogo en memoria
+    for n, email in enumerate(emails):
+        ejecutar_mezcla(nuevo_usuario(n, email), args.calentamiento, {r: {"latencias": [], "errores": 0} for r in MEZCLA}, threading.Lock())
+
+    metricas = {ruta: {"latencias": [], "errores": 0} for ruta in MEZCLA}
+    lock = threading.Lock()
+    hilos = [
+        threading.Thread(target=ejecutar_mezcla, args=(nuevo_usuario(n, email), args.peticiones, metricas, lock))
+        for n, email in enumerate(emails)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    asignaciones = medir_asignaciones(nuevo_usuario(0, emails[0]), args.asignaciones) if args.asignaciones else {}
+    if servidor is not None:
+        servidor.shutdown()
+
+    rutas = {}
+    for ruta, datos in metricas.items():
+        latencias = datos["latencias"]
+        rutas[ruta] = {
+            "n": len(latencias),
+            "errores": datos["errores"],
+            "p50_ms": _ms(percentil(latencias, 0.50)),
+            "p95_ms": _ms(percentil(latencias, 0.95)),
+            "p99_ms": _ms(percentil(latencias, 0.99)),
+            "rps": round(len(latencias) / duracion, 1),
+            "kib_por_peticion": asignaciones.get(ruta),
+        }
+    total = sum(r["n"] for r in rutas.values())
+    return {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "modo": args.modo,
+        "config": {"usuarios": args.usuarios, "peticiones": args.peticiones, "pedidos": args.pedidos},
+        "python": sys.version.split()[0],
+        "duracion_s": round(duracion, 2),
+        "rps": round(total / duracion, 1),
+        "rutas": rutas,
+    }
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 2) if segundos is not None else None
+
+
+# =================== Resultados ===================
+def commit_actual():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+        sucio = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=BASE_DIR) != 0
+        return commit + ("-dirty" if sucio else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def cargar_anterior(resultado, ruta=RESULTADOS):
+    """Última corrida guardada con el mismo modo y configuración."""
+    anterior = None
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                fila = json.loads(linea)
+                if fila["modo"] == resultado["modo"] and fila["config"] == resultado["config"]:
+                    anterior = fila
+    except FileNotFoundError:
+        pass
+    return anterior
+
+
+def guardar(resultado, ruta=RESULTADOS):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write(json.dumps(resultado, sort_keys=True) + "\n")
+
+
+def regresiones(actual, anterior, umbral):
+    """Rutas cuyo p95 subió o cuyo rps bajó más que ``umbral`` (fracción)."""
+    encontradas = []
+    for ruta, datos in actual["rutas"].items():
+        previo = anterior["rutas"].get(ruta)
+        if not previo or not previo["p95_ms"] or not previo["rps"]:
+            continue
+        if datos["p95_ms"] and datos["p95_ms"] > previo["p95_ms"] * (1 + umbral):
+            encontradas.append(f"{ruta}: p95 {previo['p95_ms']} -> {datos['p95_ms']} ms")
+        if datos["rps"] < previo["rps"] * (1 - umbral):
+            encontradas.append(f"{ruta}: rps {previo['rps']} -> {datos['rps']}")
+    return encontradas
+
+
+def imprimir(resultado):
+    print(f"\n📊 {resultado['modo']} @ {resultado['commit']} — {resultado['rps']} req/s en {resultado['duracion_s']} s")
+    print(f"{'ruta':<20}{'n':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'KiB':>9}")
+    for ruta, d in resultado["rutas"].items():
+        kib = d["kib_por_peticion"] if d["kib_por_peticion"] is not None else "-"
+        print(f"{ruta:<20}{d['n']:>7}{d['errores']:>6}{d['p50_ms']!s:>10}{d['p95_ms']!s:>10}{d['p99_ms']!s:>10}{d['rps']:>9}{kib!s:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de rutas de Agrícola Green Crop")
+    parser.add_argument("--modo", choices=["cliente", "wsgi"], default="cliente",
+                        help="cliente de pruebas de Flask o servidor WSGI real")
+    parser.add_argument("--usuarios", type=int, default=4, help="usuarios concurrentes")
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por usuario")
+    parser.add_argument("--pedidos", type=int, default=30, help="pedidos sembrados por usuario")
+    parser.add_argument("--calentamiento", type=int, default=10, help="peticiones de calentamiento por usuario")
+    parser.add_argument("--asignaciones", type=int, default=20,
+                        help="peticiones por ruta para medir memoria (0 para omitir)")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--comparar", action="store_true", help="comparar con la corrida anterior guardada")
+    parser.add_argument("--umbral", type=float, default=0.15, help="margen de regresión (0.15 = 15%%)")
+    parser.add_argument("--no-guardar", action="store_true")
+    args = parser.parse_args(argv)
+
+    resultado = correr(args)
+    imprimir(resultado)
+
+    codigo = 0
+    if args.comparar:
+        anterior = cargar_anterior(resultado)
+        if anterior is None:
+            print("ℹ️ No hay una corrida anterior con la misma configuración")
+        else:
+            encontradas = regresiones(resultado, anterior, args.umbral)
+            for r in encontradas:
+                print(f"⚠️ Regresión respecto a {anterior['commit']}: {r}")
+            if encontradas:
+                codigo = 1
+            else:
+                print(f"✅ Sin regresiones respecto a {anterior['commit']}")
+    if not args.no_guardar:
+        guardar(resultado)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from pedidos import PedidoInvalido
+
+# El carrito vive en la sesión como {"<producto_id>": cantidad}: los nombres y
+# precios se leen del catálogo en memoria, nunca del navegador.
+CLAVE_SESION = "carrito"
+MAX_PRODUCTOS = 100
+MAX_CANTIDAD = 999
+
+CENTIMO = Decimal("0.01")
+
+
+def leer(session):
+    return session.get(CLAVE_SESION) or {}
+
+
+def _guardar(session, carrito):
+    if carrito:
+        session[CLAVE_SESION] = carrito
+    else:
+        session.pop(CLAVE_SESION, None)
+
+
+def _cantidad(valor):
+    try:
+        cantidad = int(valor)
+    except (TypeError, ValueError):
+        raise PedidoInvalido("Cantidad inválida")
+    if cantidad < 0 or cantidad > MAX_CANTIDAD:
+        raise PedidoInvalido(f"La cantidad debe estar entre 0 y {MAX_CANTIDAD}")
+    return cantidad
+
+
+def fijar(session, catalogo, producto_id, cantidad):
+    """Pone la cantidad de un producto (0 lo quita)."""
+    cantidad = _cantidad(cantidad)
+    carrito = dict(leer(session))
+    clave = str(producto_id)
+    if cantidad == 0:
+        carrito.pop(clave, None)
+    else:
+        if catalogo.obtener(producto_id) is None:
+            raise PedidoInvalido("Producto no encontrado")
+        if clave not in carrito and len(carrito) >= MAX_PRODUCTOS:
+            raise PedidoInvalido(f"El carrito admite como máximo {MAX_PRODUCTOS} productos")
+        carrito[clave] = cantidad
+    _guardar(session, carrito)
+    return carrito
+
+
+def agregar(session, catalogo, producto_id, cantidad=1):
+    actual = leer(session).get(str(producto_id), 0)
+    return fijar(session, catalogo, producto_id, min(actual + _cantidad(cantidad), MAX_CANTIDAD))
+
+
+def vaciar(session):
+    session.pop(CLAVE_SESION, None)
+
+
+def cotizar(cantidades, catalogo):
+    """Precios del catálogo para {producto_id: cantidad}.
+
+    Devuelve (items, total) con items como {producto_id, nombre, cantidad,
+    precio}, el mismo formato que validar_carrito. Los productos que ya no
+    están en el catálogo hacen fallar la cotización.
+    """
+    items = []
+    total = Decimal("0")
+    productos = catalogo.obtener_varios(int(pid) for pid in cantidades)
+    for pid, cantidad in cantidades.items():
+        producto = productos.get(int(pid))
+        if producto is None:
+            raise PedidoInvalido("Un producto del carrito ya no está disponible")
+        precio = Decimal(str(producto['precio'])).quantize(CENTIMO)
+        total += precio * cantidad
+        items.append({
+            'producto_id': producto['id'],
+            'nombre': producto['nombre'],
+            'cantidad': cantidad,
+            'precio': float(precio),
+        })
+    return items, float(total.quantize(CENTIMO, rounding=ROUND_HALF_UP))
+
+
+def cantidades_de(items):
+    """{producto_id: cantidad} a partir de los items de validar_carrito (sin sus precios)."""
+    cantidades = {}
+    for item in items:
+        if item['producto_id'] is None:
+            raise PedidoInvalido("Producto sin identificador en el carrito")
+        cantidades[item['producto_id']] = _cantidad(cantidades.get(item['producto_id'], 0) + item['cantidad'])
+    return cantidades
+
+
+def resumen(session, catalogo):
+    """El carrito repreciado, para la interfaz (/api/carrito)."""
+    carrito = leer(session)
+    # Productos retirados del catálogo se descartan del carrito
+    vigentes = {pid: c for pid, c in carrito.items() if catalogo.obtener(int(pid)) is not None}
+    if len(vigentes) != len(carrito):
+        _guardar(session, vigentes)
+    items, total = cotizar(vigentes, catalogo)
+    for item in items:
+        item['imagen'] = catalogo.obtener(item['producto_id'])['imagen']
+        item['subtotal'] = round(item['precio'] * item['cantidad'], 2)
+    return {
+        'items': items,
+        'total': total,
+        'cantidad': sum(item['cantidad'] for item in items),
+    }
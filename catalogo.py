@@ -0,0 +1,160 @@
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "productos.json")
+
+COLUMNAS = ("id", "nombre", "categoria", "categoria_nombre", "precio", "imagen")
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Fosfato Diamónico' -> 'fosfato diamonico'."""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    return re.findall(r"[a-z0-9]+", normalizar(texto))
+
+
+# =================== Índice en memoria ===================
+class Catalogo:
+    """Índice en memoria de la tabla ``productos``.
+
+    - ``_indice``: token normalizado -> ids (índice invertido); la lista
+      ordenada ``_tokens`` permite buscar por prefijo con bisect.
+    - ``_por_categoria``: slug de categoría -> ids ordenados.
+
+    Cada recarga construye estructuras nuevas y las publica de una vez, así
+    las búsquedas concurrentes nunca ven un índice a medias.
+    """
+
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self.version = None
+        self._productos = {}
+        self._por_categoria = {}
+        self._indice = {}
+        self._tokens = []
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+
+    def cargar(self, filas, version):
+        productos, por_categoria, indice = {}, {}, {}
+        for fila in filas:
+            producto = {col: fila[col] for col in COLUMNAS}
+            producto["precio"] = float(producto["precio"])
+            productos[producto["id"]] = producto
+            por_categoria.setdefault(producto["categoria"], []).append(producto["id"])
+            for token in set(tokenizar(producto["nombre"]) + tokenizar(producto["categoria_nombre"])):
+                indice.setdefault(token, set()).add(producto["id"])
+
+        for ids in por_categoria.values():
+            ids.sort()
+        self._productos, self._por_categoria, self._indice = productos, por_categoria, indice
+        self._tokens = sorted(indice)
+        self.version = str(version)
+
+    def cargar_semilla(self, path=SEED_PATH):
+        with open(path, encoding="utf-8") as f:
+            self.cargar(json.load(f), "semilla")
+
+    def buscar(self, q=None, categoria=None):
+        """Ids (ordenados) que cumplen todos los prefijos de ``q`` y la categoría."""
+        indice, tokens = self._indice, self._tokens
+        resultado = None
+        for token in tokenizar(q):
+            coincidencias = set()
+            i = bisect.bisect_left(tokens, token)
+            while i < len(tokens) and tokens[i].startswith(token):
+                coincidencias |= indice[tokens[i]]
+                i += 1
+            resultado = coincidencias if resultado is None else resultado & coincidencias
+            if not resultado:
+                return []
+
+        if categoria:
+            en_categoria = self._por_categoria.get(categoria, [])
+            if resultado is None:
+                return list(en_categoria)
+            return [pid for pid in en_categoria if pid in resultado]
+        if resultado is None:
+            return sorted(self._productos)
+        return sorted(resultado)
+
+    def obtener(self, producto_id):
+        return self._productos.get(producto_id)
+
+    def obtener_varios(self, ids):
+        productos = self._productos
+        return {pid: productos[pid] for pid in ids if pid in productos}
+
+    def categorias(self):
+        return sorted(self._por_categoria)
+
+    def __len__(self):
+        return len(self._productos)
+
+    # ---------- Sincronización con MySQL ----------
+    def refrescar(self, get_connection, close_connection):
+        """Recarga el índice si cambió la versión del catálogo en MySQL.
+
+        La versión se consulta como mucho una vez cada ``check_interval``
+        segundos y solo un hilo recarga; el resto sigue usando el índice actual.
+        """
+        if time.monotonic() - self._checked_at < self.check_interval and self.version is not None:
+            return
+        if not self._reload_lock.acquire(blocking=self.version is None):
+            return
+        try:
+            if time.monotonic() - self._checked_at < self.check_interval and self.version is not None:
+                return
+            self._checked_at = time.monotonic()
+            conn = get_connection()
+            if not conn:
+                if self.version is None:
+                    self.cargar_semilla()
+                return
+            try:
+                cursor = conn.cursor(dictionary=True)
+                version = leer_version(cursor)
+                if version != self.version:
+                    cursor.execute(
+                        "SELECT id, nombre, categoria, categoria_nombre, precio, imagen "
+                        "FROM productos WHERE activo = 1"
+                    )
+                    self.cargar(cursor.fetchall(), version)
+                cursor.close()
+            except Exception:
+                logger.exception("Error cargando catálogo")
+                if self.version is None:
+                    self.cargar_semilla()
+            finally:
+                close_connection(conn)
+        finally:
+            self._reload_lock.release()
+
+
+def leer_version(cursor):
+    """Versión del catálogo: cambia al insertar, borrar o modificar productos."""
+    cursor.execute("SELECT COUNT(*) AS n, MAX(actualizado_en) AS ultima FROM productos WHERE activo = 1")
+    fila = cursor.fetchone()
+    return f"{fila['n']}-{fila['ultima']}"
+
+
+def sembrar_productos(cursor, path=SEED_PATH):
+    """Inserta los productos de data/productos.json que aún no existan."""
+    with open(path, encoding="utf-8") as f:
+        filas = json.load(f)
+    cursor.executemany(
+        "INSERT IGNORE INTO productos (id, nombre, categoria, categoria_nombre, precio, imagen) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        [tuple(fila[col] for col in COLUMNAS) for fila in filas],
+    )
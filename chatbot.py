@@ -0,0 +1,119 @@
+import html
+import json
+import math
+import os
+from collections import Counter
+from functools import lru_cache
+
+from catalogo import tokenizar
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "chatbot.json")
+
+# Palabras que no aportan a la intención ni identifican productos
+STOPWORDS = {
+    "a", "al", "de", "del", "el", "en", "la", "las", "lo", "los", "me", "mi", "mis", "para",
+    "por", "que", "se", "su", "sus", "tu", "un", "una", "y", "o", "con", "es", "hay", "tienen",
+    "tiene", "quiero", "quisiera", "necesito", "busco", "sobre", "como", "cual",
+}
+
+
+def _terminos(texto):
+    return [t for t in tokenizar(texto) if t not in STOPWORDS]
+
+
+class Chatbot:
+    """Motor de respuestas del chatbot.
+
+    Al construirse vectoriza con TF-IDF los ejemplos de cada intención de
+    data/chatbot.json; responder es un producto escalar sobre vectores
+    dispersos ya normalizados. Los nombres de productos se buscan en el
+    catálogo y las respuestas se guardan en un LRU por texto normalizado.
+    """
+
+    def __init__(self, datos, get_catalogo=None, cache_size=2048):
+        self.umbral = datos.get("umbral", 0.2)
+        self.por_defecto = datos["respuesta_por_defecto"]
+        self.intenciones = {i["id"]: i for i in datos["intenciones"]}
+        self._get_catalogo = get_catalogo
+
+        documentos = {
+            i["id"]: [t for ejemplo in i["ejemplos"] for t in _terminos(ejemplo)]
+            for i in datos["intenciones"]
+        }
+        n = len(documentos)
+        df = Counter(t for terminos in documentos.values() for t in set(terminos))
+        self._idf = {t: math.log((1 + n) / (1 + f)) + 1 for t, f in df.items()}
+        self._vectores = {iid: self._vectorizar(terminos) for iid, terminos in documentos.items()}
+        # termino -> [(intención, peso)]: solo se recorren las intenciones que comparten términos
+        self._indice = {}
+        for iid, vector in self._vectores.items():
+            for termino, peso in vector.items():
+                self._indice.setdefault(termino, []).append((iid, peso))
+
+        self._responder_cacheado = lru_cache(maxsize=cache_size)(self._responder)
+
+    @classmethod
+    def desde_archivo(cls, ruta=DATA_PATH, **kwargs):
+        with open(ruta, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _vectorizar(self, terminos):
+        tf = Counter(t for t in terminos if t in self._idf)
+        vector = {t: c * self._idf[t] for t, c in tf.items()}
+        norma = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norma for t, v in vector.items()}
+
+    # ---------- Puntuación ----------
+    def puntuar(self, mensaje):
+        """(intención, similitud coseno) más probable para el mensaje."""
+        vector = self._vectorizar(_terminos(mensaje))
+        puntajes = Counter()
+        for termino, peso in vector.items():
+            for iid, peso_intencion in self._indice.get(termino, ()):
+                puntajes[iid] += peso * peso_intencion
+        if not puntajes:
+            return None, 0.0
+        iid, puntaje = puntajes.most_common(1)[0]
+        return iid, puntaje
+
+    def puntuar_lote(self, mensajes):
+        """Puntúa muchos mensajes (p. ej. para reprocesar logs sin servidor)."""
+        return [self.puntuar(m) for m in mensajes]
+
+    # ---------- Respuestas ----------
+    def responder(self, mensaje):
+        """Devuelve {'response': html, 'options': [...]} en el formato de chatbot.js."""
+        catalogo = self._get_catalogo() if self._get_catalogo else None
+        version = catalogo.version if catalogo is not None else None
+        respuesta, opciones = self._responder_cacheado(" ".join(tokenizar(mensaje)), version, catalogo)
+        return {"response": respuesta, "options": list(opciones)}
+
+    def responder_lote(self, mensajes):
+        return [self.responder(m) for m in mensajes]
+
+    def _responder(self, texto, _version, catalogo):
+        # La versión del catálogo es parte de la clave del LRU: si cambian los
+        # productos o precios, las respuestas se recalculan.
+        productos = self._buscar_productos(texto, catalogo) if catalogo is not None else []
+        if productos:
+            lineas = "<br>".join(
+                f"• <b>{html.escape(p['nombre'])}</b> — S/ {float(p['precio']):.2f}" for p in productos
+            )
+            return (
+                f"🛒 Esto es lo que encontré:<br>{lineas}<br>"
+                "Puedes comprarlos en <a href=\"/compra_productos\">Compra</a>.",
+                ("Precios", "Asesoramiento"),
+            )
+
+        iid, puntaje = self.puntuar(texto)
+        intencion = self.intenciones[iid] if iid and puntaje >= self.umbral else self.por_defecto
+        return intencion["respuesta"], tuple(intencion.get("opciones", []))
+
+    def _buscar_productos(self, texto, catalogo, limite=3):
+        """Productos que coinciden con los términos del mensaje que no son de ninguna intención."""
+        aciertos = Counter()
+        for termino in _terminos(texto):
+            if len(termino) < 3 or termino in self._idf:
+                continue
+            aciertos.update(catalogo.buscar(q=termino))
+        return [catalogo.obtener(pid) for pid, _ in aciertos.most_common(limite)]
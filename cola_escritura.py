@@ -0,0 +1,292 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from mysql.connector import errors as mysql_errors
+
+logger = logging.getLogger(__name__)
+
+RUTA_POR_DEFECTO = os.getenv(
+    "COLA_ESCRITURA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "cola_escritura.sqlite3"),
+)
+
+# Tablas que se pueden escribir en diferido y sus columnas permitidas
+TABLAS = {
+    "contactos": ("nombre", "email", "mensaje", "ip_cliente", "fecha_creacion"),
+}
+
+# Rechazos de la base de datos que reintentar no arregla (dato demasiado
+# largo, NOT NULL, tabla inexistente...). Cualquier otro error se trata como
+# caída del túnel o de MySQL: las filas vuelven a la cola sin contar intento.
+ERRORES_DE_DATOS = (
+    mysql_errors.DataError, mysql_errors.IntegrityError, mysql_errors.ProgrammingError,
+    sqlite3.DataError, sqlite3.IntegrityError,
+)
+
+
+class ColaEscritura:
+    """Cola local y duradera (SQLite) para INSERTs que no necesitan esperar a MySQL.
+
+    ``encolar`` guarda la fila en disco y vuelve enseguida. Un hilo en segundo
+    plano vacía la cola hacia MySQL con INSERTs multi-fila y reintenta con
+    backoff si el túnel o la base de datos no responden. Las filas se reclaman
+    antes de enviarlas, así varios procesos pueden compartir el mismo archivo
+    sin duplicar escrituras.
+
+    Si MySQL rechaza un lote, sus filas se reenvían una a una: las válidas se
+    escriben y cada rechazo suma un intento. Al llegar a ``intentos_max`` la
+    fila queda como 'fallida' (ver ``fallidas``) y deja de reclamarse, así
+    una fila mala nunca bloquea al resto.
+    """
+
+    def __init__(self, get_connection, close_connection, ruta=RUTA_POR_DEFECTO,
+                 lote=100, intervalo=2.0, backoff_max=60.0, reclamo_expira=300.0, intentos_max=5):
+        self._get_connection = get_connection
+        self._close_connection = close_connection
+        self.ruta = ruta
+        self.lote = lote
+        self.intervalo = intervalo
+        self.backoff_max = backoff_max
+        self.reclamo_expira = reclamo_expira
+        self.intentos_max = intentos_max
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._hilo = None
+        self._pid = None
+        self._sqlite = None
+        self._pid_sqlite = None
+
+    # ---------- API pública ----------
+    def encolar(self, tabla, fila):
+        columnas = TABLAS.get(tabla)
+        if columnas is None or not set(fila) <= set(columnas):
+            raise ValueError(f"Escritura diferida no permitida: {tabla} {sorted(fila)}")
+        fila = dict(fila)
+        if "fecha_creacion" in columnas:
+            # La fecha real del envío, no la del momento en que se vacía la cola
+            fila.setdefault("fecha_creacion", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO cola (tabla, fila, creado) VALUES (?, ?, ?)",
+                (tabla, json.dumps(fila, sort_keys=True), time.time()),
+            )
+        self._asegurar_hilo()
+        self._evento.set()
+
+    def iniciar(self):
+        """Arranca el hilo que vacía la cola (en cada worker y en el servidor de desarrollo).
+
+        Así lo que dejó pendiente un proceso anterior se envía sin esperar a
+        que llegue una fila nueva; las filas reclamadas por un proceso que ya
+        no existe se liberan enseguida en vez de esperar ``reclamo_expira``.
+        """
+        self._liberar_huerfanas()
+        self._asegurar_hilo()
+        self._evento.set()
+
+    def pendientes(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM cola WHERE estado = 'pendiente'").fetchone()[0]
+
+    def fallidas(self, limite=100):
+        with self._lock:
+            return self._db().execute(
+                "SELECT id, tabla, fila, intentos, error FROM cola "
+                "WHERE estado = 'fallida' ORDER BY id DESC LIMIT ?", (limite,)
+            ).fetchall()
+
+    def vaciar(self):
+        """Envía a MySQL todo lo pendiente; devuelve cuántas filas se escribieron.
+
+        Las filas rechazadas en esta pasada esperan a la siguiente (``intervalo``).
+        """
+        enviadas = 0
+        while True:
+            reclamadas = self._reclamar()
+            if not reclamadas:
+                return enviadas
+            try:
+                self._enviar(reclamadas)
+            except ERRORES_DE_DATOS as e:
+                logger.warning("MySQL rechazó un lote de %s filas (%s): se envían una a una", len(reclamadas), e)
+                escritas, rechazadas = self._enviar_una_a_una(reclamadas)
+                enviadas += escritas
+                if rechazadas:
+                    return enviadas
+                continue
+            except Exception:
+                self._liberar([fila_id for fila_id, _, _ in reclamadas])
+                raise
+            self._borrar([fila_id for fila_id, _, _ in reclamadas])
+            enviadas += len(reclamadas)
+
+    def _enviar_una_a_una(self, reclamadas):
+        escritas = rechazadas = 0
+        for i, (fila_id, tabla, fila) in enumerate(reclamadas):
+            try:
+                self._enviar([(fila_id, tabla, fila)])
+            except ERRORES_DE_DATOS as e:
+                self._rechazar(fila_id, tabla, repr(e))
+                rechazadas += 1
+                continue
+            except Exception:
+                self._liberar([pendiente_id for pendiente_id, _, _ in reclamadas[i:]])
+                raise
+            self._borrar([fila_id])
+            escritas += 1
+        return escritas, rechazadas
+
+    # ---------- Hilo en segundo plano ----------
+    def _asegurar_hilo(self):
+        # Tras un fork el hilo del proceso padre no existe en el hijo
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._run, name="cola-escritura", daemon=True)
+            self._hilo.start()
+
+    def _run(self):
+        fallos = 0
+        while True:
+            espera = self.intervalo if not fallos else min(self.backoff_max, self.intervalo * 2 ** fallos)
+            self._evento.wait(espera)
+            self._evento.clear()
+            try:
+                self.vaciar()
+                fallos = 0
+            except Exception as e:
+                fallos += 1
+                logger.warning("Error vaciando la cola de escritura (intento %s): %s", fallos, e)
+
+    # ---------- SQLite ----------
+    def _db(self):
+        if self._sqlite is None or self._pid_sqlite != os.getpid():
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            db = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS cola (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tabla TEXT NOT NULL,
+                    fila TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    intentos INTEGER DEFAULT 0,
+                    reclamado_por TEXT,
+                    reclamado_en REAL
+                )
+            ''')
+            # Columnas añadidas después: los archivos ya creados se amplían
+            existentes = {col[1] for col in db.execute("PRAGMA table_info(cola)")}
+            if "estado" not in existentes:
+                db.execute("ALTER TABLE cola ADD COLUMN estado TEXT NOT NULL DEFAULT 'pendiente'")
+            if "error" not in existentes:
+                db.execute("ALTER TABLE cola ADD COLUMN error TEXT")
+            self._sqlite, self._pid_sqlite = db, os.getpid()
+        return self._sqlite
+
+    def _reclamar(self):
+        propietario = f"{os.getpid()}-{threading.get_ident()}"
+        ahora = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                filas = db.execute(
+                    "SELECT id, tabla, fila FROM cola WHERE estado = 'pendiente' "
+                    "AND (reclamado_por IS NULL OR reclamado_en < ?) ORDER BY id LIMIT ?",
+                    (ahora - self.reclamo_expira, self.lote),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE cola SET reclamado_por = ?, reclamado_en = ? WHERE id = ?",
+                    [(propietario, ahora, fila_id) for fila_id, _, _ in filas],
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return [(fila_id, tabla, json.loads(fila)) for fila_id, tabla, fila in filas]
+
+    def _borrar(self, ids):
+        with self._lock:
+            self._db().executemany("DELETE FROM cola WHERE id = ?", [(i,) for i in ids])
+
+    def _liberar(self, ids):
+        with self._lock:
+            self._db().executemany(
+                "UPDATE cola SET reclamado_por = NULL, reclamado_en = NULL WHERE id = ?",
+                [(i,) for i in ids],
+            )
+
+    def _rechazar(self, fila_id, tabla, error):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE cola SET reclamado_por = NULL, reclamado_en = NULL, intentos = intentos + 1, error = ?, "
+                "estado = CASE WHEN intentos + 1 >= ? THEN 'fallida' ELSE estado END WHERE id = ?",
+                (error, self.intentos_max, fila_id),
+            )
+            fallida = db.execute("SELECT estado = 'fallida' FROM cola WHERE id = ?", (fila_id,)).fetchone()
+        if fallida and fallida[0]:
+            logger.error("Fila %s de %s rechazada %s veces, queda como fallida: %s",
+                         fila_id, tabla, self.intentos_max, error)
+        else:
+            logger.warning("Fila %s de %s rechazada por MySQL: %s", fila_id, tabla, error)
+
+    def _liberar_huerfanas(self):
+        """Libera las filas reclamadas por procesos que ya no existen."""
+        with self._lock:
+            db = self._db()
+            propietarios = [fila[0] for fila in db.execute(
+                "SELECT DISTINCT reclamado_por FROM cola WHERE reclamado_por IS NOT NULL"
+            )]
+            muertos = [p for p in propietarios if not _proceso_vivo(p.split("-", 1)[0])]
+            db.executemany(
+                "UPDATE cola SET reclamado_por = NULL, reclamado_en = NULL WHERE reclamado_por = ?",
+                [(p,) for p in muertos],
+            )
+
+    # ---------- MySQL ----------
+    def _enviar(self, reclamadas):
+        # Agrupar por tabla y columnas para un INSERT multi-fila por grupo
+        grupos = {}
+        for _, tabla, fila in reclamadas:
+            columnas = tuple(sorted(fila))
+            grupos.setdefault((tabla, columnas), []).append(tuple(fila[c] for c in columnas))
+
+        conn = self._get_connection()
+        if not conn:
+            raise ConnectionError("Sin conexión a la base de datos")
+        try:
+            conn.start_transaction()
+            cursor = conn.cursor()
+            for (tabla, columnas), valores in grupos.items():
+                marcadores = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+                cursor.execute(
+                    f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES "
+                    + ", ".join([marcadores] * len(valores)),
+                    [v for fila in valores for v in fila],
+                )
+            conn.commit()
+            cursor.close()
+        finally:
+            self._close_connection(conn)
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
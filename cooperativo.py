@@ -0,0 +1,27 @@
+"""Ayudas para servir con workers gevent (GUNICORN_WORKER_CLASS=gevent).
+
+Con gevent parcheado, cada petición es un greenlet y la espera de red (túnel
+SSH, MySQL, SMTP) cede el control a las demás en vez de bloquear un hilo.
+Lo que no pasa por sockets de Python bloquea a todo el proceso: la extensión
+C de mysql-connector y el hash de contraseñas, que va a hilos reales.
+"""
+try:
+    from gevent import get_hub, monkey
+except ImportError:  # opcional: sin gevent se sirve con hilos (gthread)
+    get_hub = monkey = None
+
+
+def activo():
+    """True si gevent ya parcheó los sockets de este proceso."""
+    return monkey is not None and monkey.is_module_patched("socket")
+
+
+def en_hilo(funcion, *args):
+    """Ejecuta ``funcion`` en un hilo del sistema si hay gevent; si no, aquí mismo.
+
+    Para trabajo de CPU que suelta el GIL (scrypt, pbkdf2): mientras tanto
+    el resto de greenlets siguen atendiendo peticiones.
+    """
+    if not activo():
+        return funcion(*args)
+    return get_hub().threadpool.apply(funcion, args)
@@ -0,0 +1,301 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+import cooperativo
+import metrics
+from ssh_tunnel import TunnelSupervisor, ssh_forwarder_factory
+
+logger = logging.getLogger(__name__)
+
+
+# =================== Configuración ===================
+def _env_int(nombre, defecto):
+    try:
+        return int(os.getenv(nombre, defecto))
+    except (TypeError, ValueError):
+        return defecto
+
+
+def _env_float(nombre, defecto):
+    try:
+        return float(os.getenv(nombre, defecto))
+    except (TypeError, ValueError):
+        return defecto
+
+
+# =================== Pool de conexiones ===================
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera."""
+
+
+class PooledConnection:
+    """Envuelve una conexión MySQL; close() la devuelve al pool en vez de cerrarla."""
+
+    def __init__(self, pool, raw, generation):
+        self._pool = pool
+        self._raw = raw
+        self._generation = generation
+
+    def __getattr__(self, nombre):
+        if self._raw is None:
+            raise AttributeError(f"Conexión ya devuelta al pool: {nombre}")
+        return getattr(self._raw, nombre)
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise AttributeError("Conexión ya devuelta al pool: cursor")
+        return metrics.InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, self._generation)
+
+
+class ConnectionPool:
+    """Pool acotado y thread-safe de conexiones MySQL.
+
+    - Como máximo ``size`` conexiones abiertas (libres + prestadas).
+    - ``acquire`` espera hasta ``timeout`` segundos si el pool está lleno.
+    - Las conexiones libres más de ``max_idle`` segundos se cierran.
+    - Las que llevan más de ``validate_after`` segundos sin usarse se validan
+      con un ping antes de prestarlas.
+    - ``invalidate()`` (p. ej. al reiniciarse el túnel SSH) descarta las libres
+      y hace que las prestadas se cierren al devolverse.
+    """
+
+    def __init__(self, connect, size=5, timeout=5.0, max_idle=300.0, validate_after=30.0):
+        self._connect = connect
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self._idle = deque()  # (conexión, instante en que se devolvió, generación)
+        self._borrowed = 0
+        self._generation = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            raw, devuelta_en, generation = self._checkout(deadline)
+            if raw is None:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+                return PooledConnection(self, raw, generation)
+
+            if time.monotonic() - devuelta_en < self.validate_after or self._is_alive(raw):
+                return PooledConnection(self, raw, generation)
+
+            # Conexión rota: se descarta y se intenta con otra
+            self._discard(raw)
+            self._forget()
+
+    def release(self, raw, generation):
+        # Sin ping: las conexiones rotas se detectan en acquire (validate_after)
+        sana = generation == self._generation
+        try:
+            if sana and getattr(raw, "in_transaction", False):
+                raw.rollback()
+        except Exception:
+            sana = False
+
+        with self._cond:
+            self._borrowed -= 1
+            if sana and generation == self._generation:
+                self._idle.append((raw, time.monotonic(), generation))
+            else:
+                sana = False
+            self._cond.notify()
+        if not sana:
+            self._discard(raw)
+
+    def invalidate(self, *_):
+        """Descarta todas las conexiones abiertas hasta ahora."""
+        with self._cond:
+            self._generation += 1
+            libres = [raw for raw, _, _ in self._idle]
+            self._idle.clear()
+        for raw in libres:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self.size, "idle": len(self._idle), "borrowed": self._borrowed}
+
+    def _checkout(self, deadline):
+        """Reserva un hueco: devuelve (conexión libre, instante, generación) o (None, None, generación) para abrir una nueva."""
+        vencidas = []
+        try:
+            with self._cond:
+                while True:
+                    ahora = time.monotonic()
+                    # Las más antiguas están a la izquierda: se expulsan las inactivas
+                    while self._idle and ahora - self._idle[0][1] > self.max_idle:
+                        vencidas.append(self._idle.popleft()[0])
+
+                    if self._idle:
+                        raw, devuelta_en, generation = self._idle.pop()
+                        self._borrowed += 1
+                        return raw, devuelta_en, generation
+                    if self._borrowed + len(self._idle) < self.size:
+                        self._borrowed += 1
+                        return None, None, self._generation
+
+                    restante = deadline - ahora
+                    if restante <= 0:
+                        raise PoolTimeoutError(
+                            f"Pool de conexiones agotado ({self.size}) tras {self.timeout}s de espera"
+                        )
+                    self._cond.wait(restante)
+        finally:
+            for raw in vencidas:
+                self._discard(raw)
+
+    def _forget(self):
+        with self._cond:
+            self._borrowed -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_alive(raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+# =================== Túnel SSH + MySQL ===================
+_tunnel = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_tunnel():
+    """Supervisor del túnel SSH, creado una sola vez por proceso."""
+    global _tunnel
+    if _tunnel is None:
+        with _lock:
+            if _tunnel is None:
+                supervisor = TunnelSupervisor(
+                    ssh_forwarder_factory,
+                    channels=_env_int("SSH_TUNNEL_CHANNELS", 1),
+                    health_interval=_env_float("SSH_HEALTH_INTERVAL", 15),
+                    backoff_max=_env_float("SSH_BACKOFF_MAX", 60),
+                )
+                # Las conexiones abiertas por un túnel caído ya no sirven
+                supervisor.add_restart_listener(lambda _canal: get_pool().invalidate())
+                _tunnel = supervisor
+    return _tunnel
+
+
+def _connect_mysql():
+    # Conectar a MySQL usando el puerto local de uno de los canales del túnel
+    with metrics.timed("db_connect"):
+        host, port = get_tunnel().endpoint()
+        return mysql.connector.connect(
+            host=host,
+            port=port,
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            database=os.getenv("DB_NAME"),
+            autocommit=True,
+            # La extensión C no cede el control a otros greenlets mientras espera
+            use_pure=cooperativo.activo(),
+        )
+
+
+def _connect_sqlite():
+    # Backend local (DB_BACKEND=sqlite) para benchmarks y desarrollo sin túnel
+    import db_sqlite
+    return db_sqlite.connect(os.getenv("DB_SQLITE_PATH", "greencrop.sqlite3"))
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect_sqlite if os.getenv("DB_BACKEND") == "sqlite" else _connect_mysql,
+                    size=_env_int("DB_POOL_SIZE", 5),
+                    timeout=_env_float("DB_POOL_TIMEOUT", 5),
+                    max_idle=_env_float("DB_POOL_MAX_IDLE", 300),
+                    validate_after=_env_float("DB_POOL_VALIDATE_AFTER", 30),
+                )
+    return _pool
+
+
+def get_db_connection():
+    """Presta una conexión del pool (o None si MySQL no está disponible)."""
+    try:
+        with metrics.timed("db_checkout"):
+            return get_pool().acquire()
+    except Exception:
+        logger.exception("Error obteniendo conexión a la base de datos")
+        metrics.registry.inc("db_checkout_errors_total")
+        return None
+
+
+def cerrar():
+    """Cierra el pool y el túnel de este proceso (al salir un worker o antes de hacer fork)."""
+    global _tunnel, _pool
+    with _lock:
+        pool, tunnel = _pool, _tunnel
+        _pool = _tunnel = None
+    if pool is not None:
+        pool.invalidate()
+    if tunnel is not None:
+        tunnel.stop()
+
+
+def _reiniciar_tras_fork():
+    # El hijo hereda los sockets del padre: no se cierran (también se cerrarían
+    # para el padre), solo se olvidan para que el hijo abra túnel y pool propios.
+    global _tunnel, _pool, _lock
+    _tunnel = None
+    _pool = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def close_db_connection(conn):
+    """Devuelve la conexión al pool."""
+    try:
+        if conn:
+            conn.close()
+    except Exception:
+        pass
+
+
+def _metricas_pool():
+    muestras = []
+    if _pool is not None:
+        for clave, valor in _pool.stats().items():
+            muestras.append((f"db_pool_{clave}", {}, valor))
+    if _tunnel is not None:
+        for canal in _tunnel.status():
+            muestras.append(("ssh_tunnel_channel_active", {"channel": canal["channel"]}, int(canal["active"])))
+            muestras.append(("ssh_tunnel_channel_failures", {"channel": canal["channel"]}, canal["failures"]))
+    return muestras
+
+
+metrics.registry.add_collector(_metricas_pool)
@@ -0,0 +1,256 @@
+import re
+import sqlite3
+
+# Esquema equivalente al de migraciones.py para pruebas y benchmarks locales
+# (DB_BACKEND=sqlite). Al agregar una migración, reflejarla también aquí.
+ESQUEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            telefono VARCHAR(20),
+            password VARCHAR(200) NOT NULL,
+            puntos INT DEFAULT 0,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            social_id VARCHAR(100) NULL,
+            provider VARCHAR(50) NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS direcciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            alias VARCHAR(50),
+            calle VARCHAR(200),
+            ciudad VARCHAR(100),
+            estado VARCHAR(100),
+            codigo_postal VARCHAR(20),
+            pais VARCHAR(100),
+            es_principal TINYINT(1) DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INT NULL REFERENCES usuarios(id) ON DELETE SET NULL,
+            nombre_cliente VARCHAR(100),
+            email_cliente VARCHAR(100),
+            telefono_cliente VARCHAR(20),
+            direccion_cliente TEXT,
+            metodo_pago VARCHAR(50),
+            fecha_pedido TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total DECIMAL(10,2),
+            estado VARCHAR(50) DEFAULT 'pendiente',
+            datos_pedido TEXT
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS resenas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            producto_id INT NOT NULL,
+            calificacion INT NOT NULL,
+            comentario TEXT,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS lista_deseos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            producto_id INT NOT NULL,
+            fecha_agregado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS preferencias_notificacion (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            email_notificaciones TINYINT(1) DEFAULT 1,
+            sms_notificaciones TINYINT(1) DEFAULT 0,
+            emails_promocionales TINYINT(1) DEFAULT 1
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS contactos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre VARCHAR(100) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            mensaje TEXT NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_cliente VARCHAR(45) NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS productos (
+            id INT PRIMARY KEY,
+            nombre VARCHAR(150) NOT NULL,
+            categoria VARCHAR(50) NOT NULL,
+            categoria_nombre VARCHAR(100),
+            precio DECIMAL(10,2) NOT NULL,
+            imagen VARCHAR(150),
+            activo TINYINT(1) DEFAULT 1,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_productos_categoria ON productos (categoria)",
+    "CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_fecha_total ON pedidos (usuario_id, fecha_pedido, id, estado, total)",
+    "CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_estado_fecha ON pedidos (usuario_id, estado, fecha_pedido, id, total)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_lista_deseos_usuario_producto ON lista_deseos (usuario_id, producto_id)",
+    "CREATE INDEX IF NOT EXISTS idx_direcciones_usuario ON direcciones (usuario_id, es_principal)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_preferencias_usuario ON preferencias_notificacion (usuario_id)",
+    '''
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha DATE PRIMARY KEY,
+            pedidos INT NOT NULL DEFAULT 0,
+            articulos INT NOT NULL DEFAULT 0,
+            total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            puntos INT NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS ventas_productos_diarias (
+            fecha DATE NOT NULL,
+            producto_id INT NOT NULL,
+            nombre VARCHAR(150),
+            cantidad INT NOT NULL DEFAULT 0,
+            importe DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id)
+        )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_ventas_productos_producto ON ventas_productos_diarias (producto_id, fecha)",
+    '''
+        CREATE TABLE IF NOT EXISTS pedido_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pedido_id INT NOT NULL REFERENCES pedidos(id) ON DELETE CASCADE,
+            producto_id INT NULL,
+            nombre VARCHAR(150),
+            cantidad INT NOT NULL,
+            precio_unitario DECIMAL(10,2) NOT NULL
+        )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_pedido_items_pedido ON pedido_items (pedido_id)",
+    "CREATE INDEX IF NOT EXISTS idx_pedido_items_producto ON pedido_items (producto_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_resenas_usuario_producto ON resenas (usuario_id, producto_id)",
+    "CREATE INDEX IF NOT EXISTS idx_resenas_producto ON resenas (producto_id, id)",
+    '''
+        CREATE TABLE IF NOT EXISTS calificaciones_productos (
+            producto_id INT PRIMARY KEY,
+            resenas INT NOT NULL DEFAULT 0,
+            suma INT NOT NULL DEFAULT 0
+        )
+    ''',
+]
+
+# Traducciones mínimas del dialecto MySQL que usa la aplicación
+_TRADUCCIONES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.I), r"excluded.\1"),
+    (re.compile(r"\bNOW\(\)", re.I), "CURRENT_TIMESTAMP"),
+    # BEGIN IMMEDIATE ya bloquea a los demás escritores
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.I), ""),
+]
+
+
+def traducir(sql):
+    for patron, reemplazo in _TRADUCCIONES:
+        sql = patron.sub(reemplazo, sql)
+    return sql
+
+
+def _fila_dict(cursor, fila):
+    return {col[0]: valor for col, valor in zip(cursor.description, fila)}
+
+
+class SQLiteCursor:
+    """Cursor con la interfaz de mysql.connector (placeholders %s, dictionary=True)."""
+
+    def __init__(self, raw, dictionary=False):
+        self._cursor = raw.cursor()
+        if dictionary:
+            self._cursor.row_factory = _fila_dict
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(traducir(sql), tuple(params or ()))
+
+    def executemany(self, sql, filas):
+        self._cursor.executemany(traducir(sql), [tuple(f) for f in filas])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        # Ojo: en un upsert SQLite devuelve 1 aunque la fila ya existiera
+        # (MySQL devuelve 2 o 0).
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Conexión SQLite que imita lo que la app usa de mysql.connector.
+
+    Sirve para correr la aplicación y los benchmarks sin túnel SSH ni MySQL.
+    Como con MySQL, trabaja en autocommit salvo tras start_transaction().
+    """
+
+    def __init__(self, ruta):
+        self._raw = sqlite3.connect(
+            ruta, timeout=30, check_same_thread=False, isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        self._raw.execute("PRAGMA journal_mode=WAL")
+        self._raw.execute("PRAGMA synchronous=NORMAL")
+        self._raw.execute("PRAGMA foreign_keys=ON")
+
+    def cursor(self, dictionary=False, buffered=None):
+        return SQLiteCursor(self._raw, dictionary=dictionary)
+
+    def start_transaction(self):
+        self._raw.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        if self._raw.in_transaction:
+            self._raw.execute("COMMIT")
+
+    def rollback(self):
+        if self._raw.in_transaction:
+            self._raw.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        self._raw.execute("SELECT 1")
+
+    def is_connected(self):
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._raw.close()
+
+
+def connect(ruta):
+    return SQLiteConnection(ruta)
+
+
+def crear_esquema(conn):
+    cursor = conn.cursor()
+    for sentencia in ESQUEMA:
+        cursor.execute(sentencia)
+    cursor.close()
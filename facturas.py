@@ -0,0 +1,267 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from io import BytesIO
+from itertools import groupby
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+import metrics
+from db import get_db_connection, close_db_connection
+from pedidos import item_de_fila
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv(
+    "FACTURAS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "facturas"),
+)
+
+# Márgenes de la página (en puntos)
+Y_INICIAL = 750
+Y_MINIMO = 72
+LINEA = 15
+
+# Una fila por item (LEFT JOIN): el pedido y sus items en una sola consulta
+SQL_PEDIDO = '''
+    SELECT p.id, p.usuario_id, p.fecha_pedido, p.total, p.estado, u.email,
+           i.producto_id, i.nombre, i.cantidad, i.precio_unitario
+    FROM pedidos p JOIN usuarios u ON u.id = p.usuario_id
+    LEFT JOIN pedido_items i ON i.pedido_id = p.id
+    WHERE p.id = %s
+    ORDER BY i.id
+'''
+
+# Exportación masiva: también pedidos sin usuario (compras como invitado)
+SQL_EXPORTACION = '''
+    SELECT p.id, p.usuario_id, p.fecha_pedido, p.total, p.estado,
+           COALESCE(u.email, p.email_cliente) AS email,
+           i.producto_id, i.nombre, i.cantidad, i.precio_unitario
+    FROM pedidos p LEFT JOIN usuarios u ON u.id = p.usuario_id
+    LEFT JOIN pedido_items i ON i.pedido_id = p.id
+    WHERE p.fecha_pedido >= %s AND p.fecha_pedido < %s
+    ORDER BY p.fecha_pedido, p.id, i.id
+'''
+
+COLUMNAS_PEDIDO = ("id", "usuario_id", "fecha_pedido", "total", "estado", "email")
+
+
+# =================== Datos del pedido ===================
+def agrupar_items(filas):
+    """Une las filas pedido × item consecutivas en pedidos con su lista ``items``."""
+    for _, grupo in groupby(filas, key=lambda fila: fila["id"]):
+        grupo = list(grupo)
+        pedido = {col: grupo[0][col] for col in COLUMNAS_PEDIDO}
+        pedido["items"] = [item_de_fila(fila) for fila in grupo if fila["cantidad"] is not None]
+        yield pedido
+
+
+def huella(pedido):
+    """Hash del contenido que aparece en la factura: si cambia, cambia el PDF."""
+    contenido = json.dumps(
+        [pedido['id'], str(pedido['fecha_pedido']), str(pedido['total']), pedido['estado'],
+         pedido['items'], pedido['email']],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(contenido.encode()).hexdigest()[:16]
+
+
+# =================== Render ===================
+def dibujar_factura(p, pedido):
+    """Dibuja la factura en el canvas ``p``, con tantas páginas como haga falta."""
+    p.drawString(100, 750, "AGRÍCOLA GREEN CROP")
+    p.drawString(100, 735, "Factura de Compra")
+    p.drawString(100, 720, f"Factura #: {pedido['id']}")
+    fecha = pedido['fecha_pedido']
+    fecha_str = fecha.strftime('%d/%m/%Y %H:%M') if isinstance(fecha, datetime) else str(fecha)
+    p.drawString(100, 705, f"Fecha: {fecha_str}")
+    p.drawString(100, 690, f"Cliente: {pedido['email']}")
+
+    p.drawString(100, 660, "Detalles del Pedido:")
+    y = 645
+
+    for item in pedido['items']:
+        if y < Y_MINIMO:
+            p.showPage()
+            p.drawString(100, Y_INICIAL, f"Factura #: {pedido['id']} (continuación)")
+            y = Y_INICIAL - 30
+        p.drawString(100, y, f"- {item['nombre']} x {item['cantidad']} - S/ {item['precio']}")
+        y -= LINEA
+
+    if y - 40 < Y_MINIMO:
+        p.showPage()
+        y = Y_INICIAL
+    p.drawString(100, y-20, f"Total: S/ {pedido['total']}")
+    p.drawString(100, y-40, f"Estado: {pedido['estado']}")
+    p.showPage()
+
+
+def renderizar_factura(pedido):
+    with metrics.timed("pdf", kind="factura"):
+        buffer = BytesIO()
+        p = canvas.Canvas(buffer, pagesize=letter)
+        dibujar_factura(p, pedido)
+        p.save()
+        return buffer.getvalue()
+
+
+# =================== Caché en disco ===================
+def ruta_factura(pedido):
+    return os.path.join(CACHE_DIR, f"{pedido['id']}-{huella(pedido)}.pdf")
+
+
+def obtener_factura(pedido):
+    """Ruta del PDF en caché; lo genera si no existe (o si el pedido cambió)."""
+    ruta = ruta_factura(pedido)
+    if os.path.exists(ruta):
+        return ruta
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    contenido = renderizar_factura(pedido)
+    # Escritura atómica: otro hilo o proceso nunca ve un PDF a medias
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(contenido)
+    os.replace(tmp, ruta)
+
+    # Versiones anteriores de la factura del mismo pedido
+    for vieja in glob.glob(os.path.join(CACHE_DIR, f"{pedido['id']}-*.pdf")):
+        if vieja != ruta:
+            try:
+                os.remove(vieja)
+            except OSError:
+                pass
+    return ruta
+
+
+def contenido_factura(pedido):
+    """Bytes del PDF: de la caché si ya existe, si no se genera sin guardarlo."""
+    ruta = ruta_factura(pedido)
+    try:
+        with open(ruta, "rb") as f:
+            return f.read()
+    except OSError:
+        return renderizar_factura(pedido)
+
+
+# =================== Exportación masiva ===================
+class _SalidaStream:
+    """Archivo de solo escritura que acumula lo escrito hasta que se vacía.
+
+    No tiene tell/seek, así zipfile escribe en modo streaming (data
+    descriptors) sin volver atrás en el archivo.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _filas_por_lotes(cursor, lote):
+    while True:
+        filas = cursor.fetchmany(lote)
+        if not filas:
+            return
+        yield from filas
+
+
+def iterar_pedidos(desde, hasta, lote=200):
+    """Pedidos con fecha en [desde, hasta) leídos con un cursor sin buffer, por lotes."""
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(SQL_EXPORTACION, (desde, hasta))
+        try:
+            yield from agrupar_items(_filas_por_lotes(cursor, lote))
+        finally:
+            # Con un cursor sin buffer hay que consumir el resto antes de cerrar
+            try:
+                cursor.fetchall()
+            except Exception:
+                pass
+            cursor.close()
+    finally:
+        close_db_connection(conn)
+
+
+def contar_pedidos(desde, hasta):
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM pedidos WHERE fecha_pedido >= %s AND fecha_pedido < %s", (desde, hasta))
+        total = cursor.fetchone()[0]
+        cursor.close()
+        return total
+    finally:
+        close_db_connection(conn)
+
+
+def exportar_zip(pedidos):
+    """Genera un ZIP con una factura por pedido, trozo a trozo."""
+    salida = _SalidaStream()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for pedido in pedidos:
+            zf.writestr(f"factura_{pedido['id']}.pdf", contenido_factura(pedido))
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def exportar_pdf(pedidos):
+    """Un solo PDF con una o más páginas por pedido.
+
+    ReportLab no escribe el documento hasta save(), así que este formato
+    mantiene todas las páginas en memoria; la ruta limita cuántos pedidos
+    entran (FACTURAS_EXPORT_MAX_PDF).
+    """
+    with metrics.timed("pdf", kind="exportacion"):
+        buffer = BytesIO()
+        p = canvas.Canvas(buffer, pagesize=letter)
+        for pedido in pedidos:
+            dibujar_factura(p, pedido)
+        p.save()
+    yield buffer.getvalue()
+
+
+# =================== Pre-render en segundo plano ===================
+def cargar_pedido(cursor, pedido_id):
+    cursor.execute(SQL_PEDIDO, (pedido_id,))
+    return next(agrupar_items(cursor.fetchall()), None)
+
+
+def prerenderizar(pedido_id):
+    """Tarea de la cola (ver tareas.py): deja la factura en caché para la descarga.
+
+    Los errores se propagan para que la cola la reintente.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        pedido = cargar_pedido(cursor, pedido_id)
+        cursor.close()
+        if pedido:
+            obtener_factura(pedido)
+    finally:
+        close_db_connection(conn)
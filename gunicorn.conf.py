@@ -0,0 +1,88 @@
+"""Configuración de gunicorn: varios procesos con varios hilos (o greenlets) cada uno.
+
+La app se carga una vez en el maestro (preload_app) y los workers se crean
+con fork, compartiendo el código y el catálogo ya indexado. db.py, perfil_datos.py,
+metrics.py, rate_limit.py y tareas.py se reinician solos tras el fork
+(os.register_at_fork), así ningún worker usa el túnel SSH ni las conexiones de otro.
+Cada worker arranca sus propios hilos de tareas y el de la cola de escritura
+(cola_escritura.py); los archivos de las colas son compartidos.
+
+Con GUNICORN_WORKER_CLASS=gevent cada petición es un greenlet: mientras espera
+al túnel SSH o a MySQL no ocupa un hilo, así un proceso mantiene cientos de
+peticiones en curso (GUNICORN_WORKER_CONNECTIONS). Las consultas siguen
+limitadas por DB_POOL_SIZE, que conviene subir junto con SSH_TUNNEL_CHANNELS.
+Ver cooperativo.py.
+
+Recarga sin cortar peticiones:
+    kill -HUP <maestro>    nuevos workers con la misma versión del código
+    kill -USR2 <maestro>   arranca un maestro con el código nuevo; luego
+                           kill -WINCH y kill -QUIT al maestro viejo
+"""
+import logging
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND") or "0.0.0.0:5000"
+workers = int(os.getenv("GUNICORN_WORKERS") or multiprocessing.cpu_count())
+worker_class = os.getenv("GUNICORN_WORKER_CLASS") or "gthread"
+threads = int(os.getenv("GUNICORN_THREADS") or 4)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS") or 1000)
+preload_app = True
+
+if worker_class == "gevent":
+    # Con preload la app se importa en el maestro: hay que parchear antes para
+    # que los locks, hilos y sockets que crea al importarse sean de gevent
+    from gevent import monkey
+
+    monkey.patch_all()
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT") or 60)
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT") or 30)
+keepalive = 5
+# Renovar workers de vez en cuando acota fugas de memoria
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS") or 5000)
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+
+logger = logging.getLogger(__name__)
+
+
+def on_starting(server):
+    """Una sola vez, en el maestro: migraciones y catálogo antes del primer fork."""
+    import db
+    from app import get_catalogo
+    from migraciones import ejecutar_migraciones
+
+    ejecutar_migraciones()
+    get_catalogo()
+    # El maestro no atiende peticiones: se cierran túnel y conexiones para
+    # que los workers no hereden sockets abiertos
+    db.cerrar()
+
+
+def post_fork(server, worker):
+    from app import cola_escritura, tareas
+
+    tareas.iniciar()
+    # Envía lo que dejó en la cola local un worker anterior (caída o reload)
+    cola_escritura.iniciar()
+    logger.info("Worker %s iniciado", worker.pid)
+
+
+def worker_exit(server, worker):
+    """Al parar un worker (reload o apagado): vaciar la cola, esperar las tareas en curso y cerrar el túnel."""
+    import db
+    from app import cola_escritura, tareas
+
+    try:
+        cola_escritura.vaciar()
+    except Exception:
+        logger.exception("No se pudo vaciar la cola de escritura al salir")
+    tareas.detener()
+    db.cerrar()
@@ -0,0 +1,366 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Límites de los histogramas de tiempo (segundos) y de conteos por petición
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONTEO = (0, 1, 2, 3, 4, 5, 8, 12, 20, 50)
+
+SLOW_QUERY_SECONDS = float(os.getenv("METRICS_SLOW_QUERY_MS", 200)) / 1000
+
+
+# =================== Logging estructurado ===================
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con la ruta de la petición si la hay."""
+
+    CAMPOS_ESTANDAR = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        datos = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        stats = _actual.get()
+        if stats is not None:
+            datos["route"] = stats.route
+        # Campos pasados con extra={...}
+        for clave, valor in vars(record).items():
+            if clave not in self.CAMPOS_ESTANDAR and clave not in datos:
+                datos[clave] = valor
+        if record.exc_info:
+            datos["exc"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """LOG_FORMAT=json|text y LOG_LEVEL (INFO por defecto)."""
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [handler]
+    raiz.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+# =================== Registro de métricas ===================
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, valor):
+        i = 0
+        while i < len(self.buckets) and valor > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += valor
+        self.count += 1
+
+
+class Registry:
+    """Contadores e histogramas con etiquetas, en el formato de texto de Prometheus.
+
+    Las métricas son por proceso: con varios workers cada uno expone las suyas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, nombre, texto):
+        self._help[nombre] = texto
+
+    def inc(self, nombre, valor=1, **labels):
+        clave = (nombre, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[clave] = self._counters.get(clave, 0) + valor
+
+    def observe(self, nombre, valor, buckets=BUCKETS_SEGUNDOS, **labels):
+        clave = (nombre, tuple(sorted(labels.items())))
+        with self._lock:
+            histograma = self._histograms.get(clave)
+            if histograma is None:
+                histograma = self._histograms[clave] = Histogram(buckets)
+            histograma.observe(valor)
+
+    def add_collector(self, funcion):
+        """``funcion()`` devuelve [(nombre, {labels}, valor)] que se exponen como gauges."""
+        self._collectors.append(funcion)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (clave, (h.buckets, list(h.counts), h.total, h.count))
+                for clave, h in self._histograms.items()
+            )
+        lineas = []
+        vistos = set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                if nombre in self._help:
+                    lineas.append(f"# HELP {nombre} {self._help[nombre]}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, labels), valor in counters:
+            cabecera(nombre, "counter")
+            lineas.append(f"{nombre}{_labels(labels)} {valor}")
+        for (nombre, labels), (buckets, counts, total, count) in histograms:
+            cabecera(nombre, "histogram")
+            acumulado = 0
+            for limite, n in zip(buckets + ("+Inf",), counts):
+                acumulado += n
+                lineas.append(f"{nombre}_bucket{_labels(labels + (('le', limite),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_labels(labels)} {total}")
+            lineas.append(f"{nombre}_count{_labels(labels)} {count}")
+        for funcion in self._collectors:
+            try:
+                muestras = funcion()
+            except Exception:
+                logger.exception("Error en un colector de métricas")
+                continue
+            for nombre, labels, valor in muestras:
+                cabecera(nombre, "gauge")
+                lineas.append(f"{nombre}{_labels(tuple(sorted(labels.items())))} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def _labels(pares):
+    if not pares:
+        return ""
+    texto = ",".join(
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for k, v in pares
+    )
+    return "{" + texto + "}"
+
+
+registry = Registry()
+
+
+def _reiniciar_tras_fork():
+    # Cada worker empieza con métricas propias (y un lock que nadie tiene tomado)
+    registry._lock = threading.Lock()
+    registry.clear()
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+registry.describe("http_request_duration_seconds", "Duración de la petición por ruta")
+registry.describe("http_request_db_queries", "Consultas SQL por petición")
+registry.describe("http_request_db_checkouts", "Conexiones pedidas al pool por petición")
+registry.describe("http_request_phase_seconds", "Tiempo por fase (db_checkout, db_query, render, pdf) en cada petición")
+registry.describe("db_query_duration_seconds", "Duración de cada consulta por huella SQL")
+registry.describe("db_slow_queries_total", "Consultas más lentas que METRICS_SLOW_QUERY_MS")
+registry.describe("db_query_info", "Texto normalizado de cada huella SQL")
+
+
+# =================== Contexto por petición ===================
+class RequestStats:
+    """Acumula lo que pasó durante una petición (también desde hilos auxiliares)."""
+
+    def __init__(self, route):
+        self.route = route
+        self.inicio = time.perf_counter()
+        self.conteos = {}
+        self.tiempos = {}
+        self._lock = threading.Lock()
+
+    def add(self, fase, segundos):
+        with self._lock:
+            self.conteos[fase] = self.conteos.get(fase, 0) + 1
+            self.tiempos[fase] = self.tiempos.get(fase, 0.0) + segundos
+
+
+_actual = contextvars.ContextVar("request_stats", default=None)
+
+
+def begin_request(route):
+    stats = RequestStats(route)
+    return stats, _actual.set(stats)
+
+
+def end_request(stats, token, method, status):
+    try:
+        _actual.reset(token)
+    except ValueError:
+        # Respuestas en streaming: el cierre puede llegar desde otro contexto
+        _actual.set(None)
+    duracion = time.perf_counter() - stats.inicio
+    labels = {"route": stats.route, "method": method}
+    registry.inc("http_requests_total", route=stats.route, method=method, status=str(status))
+    registry.observe("http_request_duration_seconds", duracion, **labels)
+    registry.observe("http_request_db_queries", stats.conteos.get("db_query", 0), buckets=BUCKETS_CONTEO, **labels)
+    registry.observe("http_request_db_checkouts", stats.conteos.get("db_checkout", 0), buckets=BUCKETS_CONTEO, **labels)
+    for fase, segundos in stats.tiempos.items():
+        registry.observe("http_request_phase_seconds", segundos, phase=fase, **labels)
+    return duracion
+
+
+def submit(executor, funcion, *args):
+    """executor.submit que conserva la petición actual en el hilo auxiliar."""
+    return executor.submit(contextvars.copy_context().run, funcion, *args)
+
+
+@contextmanager
+def timed(fase, **labels):
+    """Mide un bloque: histograma global ``<fase>_seconds`` y suma a la petición actual."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        registry.observe(f"{fase}_seconds", segundos, **labels)
+        stats = _actual.get()
+        if stats is not None:
+            stats.add(fase, segundos)
+
+
+# =================== SQL ===================
+_LITERALES = [
+    (re.compile(r"'(?:[^'\\]|\\.)*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"\s+"), " "),
+]
+_huellas = {}
+
+
+def fingerprint(sql):
+    """(id corto, SQL normalizado) sin literales, para agrupar consultas iguales."""
+    huella = _huellas.get(sql)
+    if huella is None:
+        normalizado = sql
+        for patron, reemplazo in _LITERALES:
+            normalizado = patron.sub(reemplazo, normalizado)
+        normalizado = normalizado.strip()
+        huella = (hashlib.sha1(normalizado.encode()).hexdigest()[:10], normalizado)
+        if len(_huellas) < 2048:
+            _huellas[sql] = huella
+    return huella
+
+
+class InstrumentedCursor:
+    """Cursor que mide cada execute; el resto se delega al cursor real."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, *args, **kwargs):
+        with _medir_consulta(sql):
+            return self._cursor.execute(sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        with _medir_consulta(sql):
+            return self._cursor.executemany(sql, *args, **kwargs)
+
+
+@contextmanager
+def _medir_consulta(sql):
+    huella, normalizado = fingerprint(sql)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        registry.observe("db_query_duration_seconds", segundos, query=huella)
+        stats = _actual.get()
+        if stats is not None:
+            stats.add("db_query", segundos)
+        if segundos >= SLOW_QUERY_SECONDS:
+            registry.inc("db_slow_queries_total", query=huella)
+            logger.warning(
+                "Consulta lenta",
+                extra={"query": huella, "sql": normalizado[:500], "ms": round(segundos * 1000, 1)},
+            )
+
+
+def _info_consultas():
+    return [("db_query_info", {"query": h, "sql": s[:200]}, 1) for h, s in set(_huellas.values())]
+
+
+registry.add_collector(_info_consultas)
+
+
+# =================== Flask ===================
+def instrument_flask(app):
+    """Registra los hooks por petición, la medición de plantillas y GET /metrics.
+
+    /metrics queda abierto salvo que METRICS_TOKEN esté definido (Bearer).
+    """
+    from flask import Response, abort, before_render_template, g, request, template_rendered
+
+    @app.before_request
+    def _inicio_metricas():
+        route = request.url_rule.rule if request.url_rule is not None else "<sin ruta>"
+        g._metricas = begin_request(route)
+
+    @app.after_request
+    def _estado_metricas(response):
+        g._metricas_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _fin_metricas(exc):
+        actual = g.pop("_metricas", None)
+        if actual is not None:
+            status = g.pop("_metricas_status", 500 if exc is not None else 200)
+            end_request(*actual, request.method, status)
+
+    # Una pila por hilo: las plantillas pueden incluir o renderizar otras
+    renders = threading.local()
+
+    def _antes_de_render(sender, template, context, **extra):
+        renders.__dict__.setdefault("pila", []).append(time.perf_counter())
+
+    def _despues_de_render(sender, template, context, **extra):
+        pila = renders.__dict__.get("pila")
+        if not pila:
+            return
+        segundos = time.perf_counter() - pila.pop()
+        registry.observe("render_seconds", segundos, template=template.name or "<string>")
+        stats = _actual.get()
+        if stats is not None:
+            stats.add("render", segundos)
+
+    before_render_template.connect(_antes_de_render, app, weak=False)
+    template_rendered.connect(_despues_de_render, app, weak=False)
+
+    @app.route("/metrics")
+    def metrics():
+        token = os.getenv("METRICS_TOKEN")
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
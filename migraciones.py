@@ -0,0 +1,272 @@
+import logging
+
+from catalogo import sembrar_productos
+from db import get_db_connection, close_db_connection
+from pedidos import rellenar_items
+from reportes import TABLAS_RESUMEN
+from resenas import TABLA_CALIFICACIONES, recalcular
+
+logger = logging.getLogger(__name__)
+
+
+# =================== Pasos de migración ===================
+def crear_indice(tabla, nombre, columnas, unico=False):
+    """Paso que crea un índice solo si aún no existe (MySQL no tiene CREATE INDEX IF NOT EXISTS)."""
+    def paso(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (tabla, nombre),
+        )
+        if cursor.fetchone():
+            return
+        tipo = "UNIQUE INDEX" if unico else "INDEX"
+        cursor.execute(f"CREATE {tipo} {nombre} ON {tabla} ({', '.join(columnas)})")
+    return paso
+
+
+def eliminar_indice(tabla, nombre):
+    """Paso que borra un índice si existe (p. ej. uno que otro más amplio ya cubre)."""
+    def paso(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (tabla, nombre),
+        )
+        if cursor.fetchone():
+            cursor.execute(f"DROP INDEX {nombre} ON {tabla}")
+    return paso
+
+
+TABLAS_BASE = [
+    # Usuarios
+    '''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            telefono VARCHAR(20),
+            password VARCHAR(200) NOT NULL,
+            puntos INT DEFAULT 0,
+            fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
+            social_id VARCHAR(100) NULL,
+            provider VARCHAR(50) NULL
+        )
+    ''',
+    # Direcciones
+    '''
+        CREATE TABLE IF NOT EXISTS direcciones (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT NOT NULL,
+            alias VARCHAR(50),
+            calle VARCHAR(200) NOT NULL,
+            ciudad VARCHAR(100) NOT NULL,
+            estado VARCHAR(100),
+            codigo_postal VARCHAR(20),
+            pais VARCHAR(100) NOT NULL,
+            es_principal TINYINT(1) DEFAULT 0,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+        )
+    ''',
+    # Pedidos
+    '''
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT NULL,
+            nombre_cliente VARCHAR(100),
+            email_cliente VARCHAR(100),
+            telefono_cliente VARCHAR(20),
+            direccion_cliente TEXT,
+            metodo_pago VARCHAR(50),
+            fecha_pedido DATETIME DEFAULT CURRENT_TIMESTAMP,
+            total DECIMAL(10,2),
+            estado VARCHAR(50) DEFAULT 'pendiente',
+            datos_pedido TEXT,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE SET NULL
+        )
+    ''',
+    # Reseñas
+    '''
+        CREATE TABLE IF NOT EXISTS resenas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT NOT NULL,
+            producto_id INT NOT NULL,
+            calificacion INT NOT NULL,
+            comentario TEXT,
+            fecha_creacion DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+        )
+    ''',
+    # Lista de deseos
+    '''
+        CREATE TABLE IF NOT EXISTS lista_deseos (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT NOT NULL,
+            producto_id INT NOT NULL,
+            fecha_agregado DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+        )
+    ''',
+    # Preferencias de notificación
+    '''
+        CREATE TABLE IF NOT EXISTS preferencias_notificacion (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT NOT NULL,
+            email_notificaciones TINYINT(1) DEFAULT 1,
+            sms_notificaciones TINYINT(1) DEFAULT 0,
+            emails_promocionales TINYINT(1) DEFAULT 1,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+        )
+    ''',
+    # Contactos
+    '''
+        CREATE TABLE IF NOT EXISTS contactos (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            mensaje TEXT NOT NULL,
+            fecha_creacion DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ip_cliente VARCHAR(45) NULL
+        )
+    ''',
+    # Productos (catálogo servido por /api/productos)
+    '''
+        CREATE TABLE IF NOT EXISTS productos (
+            id INT PRIMARY KEY,
+            nombre VARCHAR(150) NOT NULL,
+            categoria VARCHAR(50) NOT NULL,
+            categoria_nombre VARCHAR(100),
+            precio DECIMAL(10,2) NOT NULL,
+            imagen VARCHAR(150),
+            activo TINYINT(1) DEFAULT 1,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_productos_categoria (categoria)
+        )
+    ''',
+]
+
+# (versión, descripción, pasos). Cada paso es una sentencia SQL o una función
+# que recibe el cursor. Las versiones ya aplicadas se guardan en
+# schema_migrations; nunca se edita una migración publicada, se añade otra.
+MIGRACIONES = [
+    (1, "Tablas base", TABLAS_BASE + [sembrar_productos]),
+    (2, "Índices para las consultas frecuentes", [
+        # Historial de pedidos por usuario (ORDER BY fecha_pedido, id)
+        crear_indice("pedidos", "idx_pedidos_usuario_fecha", ["usuario_id", "fecha_pedido", "id"]),
+        # Un producto solo una vez en la lista de deseos de cada usuario
+        """
+        DELETE a FROM lista_deseos a
+        JOIN lista_deseos b
+          ON a.usuario_id = b.usuario_id AND a.producto_id = b.producto_id AND a.id > b.id
+        """,
+        crear_indice("lista_deseos", "uq_lista_deseos_usuario_producto", ["usuario_id", "producto_id"], unico=True),
+        crear_indice("direcciones", "idx_direcciones_usuario", ["usuario_id", "es_principal"]),
+        # Una fila de preferencias por usuario (se conserva la más reciente)
+        """
+        DELETE a FROM preferencias_notificacion a
+        JOIN preferencias_notificacion b
+          ON a.usuario_id = b.usuario_id AND a.id < b.id
+        """,
+        crear_indice("preferencias_notificacion", "uq_preferencias_usuario", ["usuario_id"], unico=True),
+    ]),
+    # Los pedidos anteriores se suman con: python reportes.py
+    (3, "Resúmenes de ventas diarios y por producto", TABLAS_RESUMEN),
+    # Items en filas propias: facturas, detalle y reportes ya no parsean datos_pedido
+    (4, "Tabla pedido_items", [
+        '''
+        CREATE TABLE IF NOT EXISTS pedido_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            pedido_id INT NOT NULL,
+            producto_id INT NULL,
+            nombre VARCHAR(150),
+            cantidad INT NOT NULL,
+            precio_unitario DECIMAL(10,2) NOT NULL,
+            INDEX idx_pedido_items_pedido (pedido_id),
+            INDEX idx_pedido_items_producto (producto_id),
+            FOREIGN KEY (pedido_id) REFERENCES pedidos(id) ON DELETE CASCADE
+        )
+        ''',
+        rellenar_items,
+    ]),
+    (5, "Una reseña por usuario y producto, con calificación acumulada", [
+        # Se conserva la reseña más reciente de cada usuario para cada producto
+        """
+        DELETE a FROM resenas a
+        JOIN resenas b
+          ON a.usuario_id = b.usuario_id AND a.producto_id = b.producto_id AND a.id < b.id
+        """,
+        crear_indice("resenas", "uq_resenas_usuario_producto", ["usuario_id", "producto_id"], unico=True),
+        # Reseñas de un producto, de la más reciente a la más antigua
+        crear_indice("resenas", "idx_resenas_producto", ["producto_id", "id"]),
+        TABLA_CALIFICACIONES,
+        recalcular,
+    ]),
+    # Historial paginado (/perfil y /api/pedidos) leído solo del índice: las
+    # columnas proyectadas van en él y el filtro por estado no toca la tabla
+    (6, "Índices cubrientes para el historial de pedidos", [
+        crear_indice("pedidos", "idx_pedidos_usuario_fecha_total",
+                     ["usuario_id", "fecha_pedido", "id", "estado", "total"]),
+        crear_indice("pedidos", "idx_pedidos_usuario_estado_fecha",
+                     ["usuario_id", "estado", "fecha_pedido", "id", "total"]),
+        # Prefijo del primero: ya no aporta y encarece cada INSERT
+        eliminar_indice("pedidos", "idx_pedidos_usuario_fecha"),
+    ]),
+]
+
+
+# =================== Ejecución ===================
+def aplicar_migraciones(conn, migraciones=MIGRACIONES):
+    """Aplica en orden las migraciones pendientes y devuelve sus versiones."""
+    cursor = conn.cursor(buffered=True)
+    aplicadas = []
+    # Evita que dos procesos migren a la vez
+    cursor.execute("SELECT GET_LOCK('schema_migrations', 60)")
+    if not cursor.fetchone()[0]:
+        cursor.close()
+        raise RuntimeError("No se pudo obtener el bloqueo de migraciones")
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                descripcion VARCHAR(200),
+                aplicada_en DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("SELECT version FROM schema_migrations")
+        hechas = {row[0] for row in cursor.fetchall()}
+
+        for version, descripcion, pasos in migraciones:
+            if version in hechas:
+                continue
+            for paso in pasos:
+                if callable(paso):
+                    paso(cursor)
+                else:
+                    cursor.execute(paso)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, descripcion) VALUES (%s, %s)",
+                (version, descripcion),
+            )
+            conn.commit()
+            aplicadas.append(version)
+            logger.info("Migración %s aplicada: %s", version, descripcion)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+        cursor.fetchall()
+        cursor.close()
+    return aplicadas
+
+
+def ejecutar_migraciones():
+    """Punto de entrada al arrancar la app (sustituye a init_db)."""
+    conn = get_db_connection()
+    if conn is None:
+        logger.error("No se pudo inicializar DB")
+        return
+    try:
+        aplicadas = aplicar_migraciones(conn)
+        if not aplicadas:
+            logger.info("Esquema al día")
+    except Exception:
+        logger.exception("Error aplicando migraciones")
+    finally:
+        close_db_connection(conn)
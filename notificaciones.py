@@ -0,0 +1,93 @@
+"""Correos a clientes: bienvenida y confirmación de pedido.
+
+Se envían por SMTP a SMTP_HOST:SMTP_PORT; en desarrollo sirve un servidor
+local de prueba (``python -m aiosmtpd -n -l localhost:1025``). Sin SMTP_HOST
+el correo solo se registra en el log. Las funciones se ejecutan como tareas
+(ver tareas.py): si fallan, la cola las reintenta.
+"""
+import logging
+import os
+import smtplib
+from email.message import EmailMessage
+
+from db import get_db_connection, close_db_connection
+from pedidos import cargar_items
+
+logger = logging.getLogger(__name__)
+
+
+def enviar(destinatario, asunto, cuerpo):
+    mensaje = EmailMessage()
+    mensaje["From"] = os.getenv("SMTP_FROM", "Agrícola Green Crop <no-responder@greencrop.local>")
+    mensaje["To"] = destinatario
+    mensaje["Subject"] = asunto
+    mensaje.set_content(cuerpo)
+
+    host = os.getenv("SMTP_HOST")
+    if not host:
+        logger.info("Correo a %s (sin SMTP_HOST, no se envía): %s", destinatario, asunto)
+        return
+    with smtplib.SMTP(host, int(os.getenv("SMTP_PORT") or 25), timeout=10) as smtp:
+        smtp.send_message(mensaje)
+
+
+def acepta_correos(cursor, usuario_id):
+    """preferencias_notificacion.email_notificaciones; sin fila, el valor por defecto (sí)."""
+    cursor.execute(
+        "SELECT email_notificaciones FROM preferencias_notificacion WHERE usuario_id = %s", (usuario_id,)
+    )
+    fila = cursor.fetchone()
+    return fila is None or bool(fila["email_notificaciones"])
+
+
+def _consultar(funcion):
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        resultado = funcion(cursor)
+        cursor.close()
+        return resultado
+    finally:
+        close_db_connection(conn)
+
+
+# =================== Tareas ===================
+def bienvenida(usuario_id):
+    def datos(cursor):
+        cursor.execute("SELECT email FROM usuarios WHERE id = %s", (usuario_id,))
+        usuario = cursor.fetchone()
+        return usuario if usuario and acepta_correos(cursor, usuario_id) else None
+
+    usuario = _consultar(datos)
+    if usuario:
+        enviar(
+            usuario["email"], "¡Bienvenido a Agrícola Green Crop!",
+            "Tu cuenta está lista. Con cada compra acumulas 1 punto por cada S/ 10.\n",
+        )
+
+
+def confirmacion_pedido(pedido_id):
+    def datos(cursor):
+        cursor.execute(
+            '''SELECT p.id, p.usuario_id, p.total, COALESCE(u.email, p.email_cliente) AS email
+            FROM pedidos p LEFT JOIN usuarios u ON u.id = p.usuario_id WHERE p.id = %s''',
+            (pedido_id,),
+        )
+        pedido = cursor.fetchone()
+        # Las compras como invitado no tienen preferencias: se confirma siempre
+        if not pedido or not pedido["email"]:
+            return None
+        if pedido["usuario_id"] and not acepta_correos(cursor, pedido["usuario_id"]):
+            return None
+        pedido["items"] = cargar_items(cursor, [pedido_id])[pedido_id]
+        return pedido
+
+    pedido = _consultar(datos)
+    if pedido:
+        lineas = [f"- {i['nombre']} x {i['cantidad']}: S/ {i['precio'] * i['cantidad']:.2f}" for i in pedido["items"]]
+        enviar(
+            pedido["email"], f"Pedido #{pedido_id} recibido",
+            "Recibimos tu pedido:\n\n" + "\n".join(lineas) + f"\n\nTotal: S/ {float(pedido['total']):.2f}\n",
+        )
@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import threading
+from functools import wraps
+
+from flask import Response, request, session
+from flask_login import current_user
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se sirve gzip o sin comprimir
+    brotli = None
+
+
+class Pagina:
+    """HTML renderizado una vez, con sus versiones comprimidas y su ETag."""
+
+    __slots__ = ("cuerpos", "etag")
+
+    def __init__(self, html):
+        datos = html.encode("utf-8")
+        self.etag = hashlib.sha256(datos).hexdigest()[:20]
+        self.cuerpos = {"identity": datos, "gzip": gzip.compress(datos, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.cuerpos["br"] = brotli.compress(datos, quality=11)
+
+
+class PageCache:
+    """Caché en memoria de páginas sin datos propios (index, blog, nosotros...).
+
+    Se guarda una variante por ruta, por estado de sesión (anónimo o con
+    sesión iniciada) y por la variante extra que indique la ruta. Si hay
+    mensajes flash pendientes la página se renderiza normalmente.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._paginas = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._paginas.clear()
+
+    def cached(self, variante=None):
+        """Decorador para vistas que devuelven el HTML de render_template.
+
+        ``variante()`` devuelve una clave extra (p. ej. la categoría) o None
+        para no usar la caché en esa petición.
+        """
+        def decorador(vista):
+            @wraps(vista)
+            def envoltura(*args, **kwargs):
+                if not self.enabled or session.get("_flashes"):
+                    return vista(*args, **kwargs)
+                extra = variante() if variante is not None else ""
+                if extra is None:
+                    return vista(*args, **kwargs)
+
+                autenticado = current_user.is_authenticated
+                clave = (request.endpoint, autenticado, extra)
+                pagina = self._paginas.get(clave)
+                if pagina is None:
+                    pagina = Pagina(vista(*args, **kwargs))
+                    with self._lock:
+                        pagina = self._paginas.setdefault(clave, pagina)
+                return self._responder(pagina, autenticado)
+            return envoltura
+        return decorador
+
+    @staticmethod
+    def _responder(pagina, autenticado):
+        codificacion = "identity"
+        for candidata in ("br", "gzip"):
+            if candidata in pagina.cuerpos and request.accept_encodings[candidata]:
+                codificacion = candidata
+                break
+
+        response = Response(pagina.cuerpos[codificacion], mimetype="text/html")
+        if codificacion != "identity":
+            response.headers["Content-Encoding"] = codificacion
+        # ETag fuerte por representación: cada codificación tiene sus propios bytes
+        response.set_etag(f"{pagina.etag}-{codificacion}")
+        response.headers["Cache-Control"] = "private, no-cache" if autenticado else "no-cache"
+        response.vary.update(("Accept-Encoding", "Cookie"))
+        return response.make_conditional(request)
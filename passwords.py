@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import cooperativo
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Costos por defecto de Werkzeug 2.3: los hashes ya guardados no se rehacen
+# mientras no se cambie la configuración
+COSTO_POR_DEFECTO = {"scrypt": 2 ** 15, "pbkdf2": 600_000}
+# Límites de la calibración: nunca más débil que el mínimo, y scrypt usa
+# 1 KiB * N de memoria por hash (2**16 = 64 MiB por hilo)
+COSTO_MINIMO = {"scrypt": 2 ** 14, "pbkdf2": 100_000}
+COSTO_MAXIMO = {"scrypt": 2 ** 16, "pbkdf2": 5_000_000}
+SCRYPT_R, SCRYPT_P = 8, 1
+
+
+def parametros(guardado):
+    """(algoritmo, costo) de un hash guardado: 'scrypt:32768:8:1$...' -> ('scrypt', 32768)."""
+    partes = guardado.split("$", 1)[0].split(":")
+    algoritmo = partes[0]
+    try:
+        if algoritmo == "scrypt":
+            return algoritmo, int(partes[1]) if len(partes) > 1 else COSTO_POR_DEFECTO["scrypt"]
+        if algoritmo == "pbkdf2":
+            return algoritmo, int(partes[2]) if len(partes) > 2 else COSTO_POR_DEFECTO["pbkdf2"]
+    except ValueError:
+        pass
+    return algoritmo, None
+
+
+class PasswordHasher:
+    """Hash de contraseñas con algoritmo y costo explícitos.
+
+    ``costo`` es N para scrypt y las iteraciones para pbkdf2. Los hashes
+    guardados llevan sus parámetros (``scrypt:32768:8:1$sal$hash``), así que
+    ``necesita_rehash`` sabe cuáles quedaron desactualizados.
+    """
+
+    def __init__(self, algoritmo="scrypt", costo=None):
+        if algoritmo not in COSTO_POR_DEFECTO:
+            raise ValueError(f"Algoritmo de contraseñas no soportado: {algoritmo}")
+        self.algoritmo = algoritmo
+        self.costo = int(costo or COSTO_POR_DEFECTO[algoritmo])
+        self.ultima_medicion_ms = None
+
+    @classmethod
+    def desde_entorno(cls):
+        hasher = cls(os.getenv("PASSWORD_HASH", "scrypt"), os.getenv("PASSWORD_HASH_COST") or None)
+        objetivo = os.getenv("PASSWORD_HASH_TARGET_MS")
+        if objetivo:
+            hasher.calibrar(float(objetivo))
+        else:
+            hasher.medir()
+        logger.info("Contraseñas con %s: %.0f ms por hash", hasher.metodo, hasher.ultima_medicion_ms)
+        return hasher
+
+    @property
+    def metodo(self):
+        if self.algoritmo == "scrypt":
+            return f"scrypt:{self.costo}:{SCRYPT_R}:{SCRYPT_P}"
+        return f"pbkdf2:sha256:{self.costo}"
+
+    def hash(self, password):
+        with metrics.timed("password_hash", op="hash"):
+            return cooperativo.en_hilo(generate_password_hash, password, self.metodo)
+
+    def verificar(self, guardado, password):
+        if not guardado:
+            return False
+        with metrics.timed("password_hash", op="verify"):
+            return cooperativo.en_hilo(check_password_hash, guardado, password)
+
+    def necesita_rehash(self, guardado):
+        """Solo si cambió el algoritmo o el costo guardado es menor que el actual.
+
+        La calibración varía un poco entre arranques: un costo igual o mayor
+        al configurado no obliga a rehacer el hash (ni lo debilita).
+        """
+        algoritmo, costo = parametros(guardado)
+        return algoritmo != self.algoritmo or costo is None or costo < self.costo
+
+    def medir(self, repeticiones=3):
+        """Milisegundos por hash con los parámetros actuales (la mejor de varias pasadas)."""
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            generate_password_hash("calibracion", method=self.metodo)
+            duracion = (time.perf_counter() - inicio) * 1000
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        self.ultima_medicion_ms = mejor
+        return mejor
+
+    def calibrar(self, objetivo_ms):
+        """Ajusta el costo al mayor que entra en ``objetivo_ms`` en esta máquina."""
+        minimo, maximo = COSTO_MINIMO[self.algoritmo], COSTO_MAXIMO[self.algoritmo]
+        self.costo = minimo
+        por_unidad = self.medir() / minimo
+        if self.algoritmo == "scrypt":
+            # N tiene que ser potencia de 2
+            while self.costo * 2 <= maximo and self.costo * 2 * por_unidad <= objetivo_ms:
+                self.costo *= 2
+        else:
+            iteraciones = int(objetivo_ms / por_unidad) // 10_000 * 10_000
+            self.costo = max(minimo, min(maximo, iteraciones))
+        self.medir()
+        if self.ultima_medicion_ms > objetivo_ms:
+            logger.warning(
+                "El costo mínimo de %s (%.0f ms) supera el objetivo de %.0f ms",
+                self.metodo, self.ultima_medicion_ms, objetivo_ms,
+            )
+        return self.costo
@@ -0,0 +1,263 @@
+import json
+import logging
+from datetime import datetime, time, timedelta
+
+from db import get_db_connection, close_db_connection
+from reportes import acumular_pedido
+
+logger = logging.getLogger(__name__)
+
+PEDIDOS_POR_PAGINA = 10
+
+
+# =================== Paginación por cursor (keyset) ===================
+def codificar_cursor(fecha_pedido, pedido_id):
+    """Cursor opaco para la siguiente página: '<fecha ISO>_<id>'."""
+    return f"{fecha_pedido.isoformat()}_{pedido_id}"
+
+
+def decodificar_cursor(cursor_str):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    if not cursor_str:
+        return None
+    try:
+        fecha, _, pedido_id = cursor_str.rpartition("_")
+        return datetime.fromisoformat(fecha), int(pedido_id)
+    except ValueError:
+        return None
+
+
+def listar_pedidos(cursor, usuario_id, antes=None, limite=PEDIDOS_POR_PAGINA,
+                   estado=None, desde=None, hasta=None, con_datos=False):
+    """Una página del historial, del más reciente al más antiguo.
+
+    ``antes`` es el (fecha_pedido, id) del último pedido de la página anterior.
+    ``estado`` y el rango de fechas ``desde``/``hasta`` (date, ambos incluidos)
+    filtran; ``con_datos`` añade el JSON de datos_pedido, que no está en el
+    índice idx_pedidos_usuario_fecha_total y obliga a leer cada fila.
+    Devuelve (pedidos, cursor_siguiente); el cursor es None en la última página.
+    Los items no se cargan: se piden aparte al expandir un pedido.
+    """
+    columnas = 'id, fecha_pedido, total, estado' + (', datos_pedido' if con_datos else '')
+    sql = f'SELECT {columnas} FROM pedidos WHERE usuario_id = %s'
+    params = [usuario_id]
+    if estado:
+        sql += ' AND estado = %s'
+        params.append(estado)
+    if desde:
+        sql += ' AND fecha_pedido >= %s'
+        params.append(datetime.combine(desde, time.min))
+    if hasta:
+        sql += ' AND fecha_pedido < %s'
+        params.append(datetime.combine(hasta + timedelta(days=1), time.min))
+    if antes:
+        sql += ' AND (fecha_pedido < %s OR (fecha_pedido = %s AND id < %s))'
+        params += [antes[0], antes[0], antes[1]]
+    sql += ' ORDER BY fecha_pedido DESC, id DESC LIMIT %s'
+    params.append(limite + 1)
+
+    cursor.execute(sql, params)
+    filas = cursor.fetchall()
+    pedidos = []
+    for row in filas[:limite]:
+        pedido = {
+            'id': row['id'],
+            'fecha_pedido': row['fecha_pedido'],
+            'total': float(row['total']) if row['total'] is not None else 0.0,
+            'estado': row['estado'],
+        }
+        if con_datos:
+            pedido['datos'] = _cargar_json(row['datos_pedido'])
+        pedidos.append(pedido)
+    siguiente = None
+    if len(filas) > limite:
+        ultimo = pedidos[-1]
+        siguiente = codificar_cursor(ultimo['fecha_pedido'], ultimo['id'])
+    return pedidos, siguiente
+
+
+def _cargar_json(texto):
+    try:
+        return json.loads(texto) if texto else None
+    except ValueError:
+        return None
+
+
+# =================== Servicio de pedidos ===================
+class PedidoInvalido(ValueError):
+    """Datos del pedido que no se pueden registrar (carrito o total mal formados)."""
+
+
+def validar_carrito(datos_pedido, requerido=True):
+    """Parsea y normaliza el carrito una sola vez.
+
+    Acepta el JSON de crear_pedido ({'items': [...], 'nombre': ...}) y la lista
+    del carrito de compra.js ({id, name, price, quantity}). Devuelve
+    (datos, items) con items como {producto_id, nombre, cantidad, precio}.
+    """
+    try:
+        datos = json.loads(datos_pedido) if isinstance(datos_pedido, str) and datos_pedido else datos_pedido
+    except ValueError:
+        raise PedidoInvalido("El carrito no es un JSON válido")
+    if datos is None:
+        datos = {}
+    if isinstance(datos, list):
+        datos = {'items': datos}
+    if not isinstance(datos, dict) or not isinstance(datos.get('items', []), list):
+        raise PedidoInvalido("Formato de carrito no reconocido")
+
+    items = []
+    for item in datos.get('items', []):
+        if not isinstance(item, dict):
+            raise PedidoInvalido("Item de carrito inválido")
+        try:
+            cantidad = int(item.get('cantidad', item.get('quantity', 1)))
+            precio = float(item.get('precio', item.get('price', 0)))
+            producto_id = item.get('producto_id', item.get('id'))
+            producto_id = int(producto_id) if producto_id is not None else None
+        except (TypeError, ValueError):
+            raise PedidoInvalido("Cantidad o precio inválido en el carrito")
+        if cantidad <= 0 or precio < 0:
+            raise PedidoInvalido("Cantidad o precio inválido en el carrito")
+        items.append({
+            'producto_id': producto_id,
+            'nombre': str(item.get('nombre', item.get('name', ''))).strip(),
+            'cantidad': cantidad,
+            'precio': precio,
+        })
+
+    if requerido and not items:
+        raise PedidoInvalido("El carrito está vacío")
+    datos['items'] = items
+    return datos, items
+
+
+def validar_total(total):
+    try:
+        total = round(float(total), 2) if total not in (None, '') else 0.0
+    except (TypeError, ValueError):
+        raise PedidoInvalido("Total inválido")
+    if total < 0:
+        raise PedidoInvalido("Total inválido")
+    return total
+
+
+# =================== Items del pedido ===================
+SQL_INSERTAR_ITEMS = '''
+    INSERT INTO pedido_items (pedido_id, producto_id, nombre, cantidad, precio_unitario)
+    VALUES (%s, %s, %s, %s, %s)
+'''
+
+
+def guardar_items(cursor, pedido_id, items):
+    """Inserta los items normalizados (ver validar_carrito) de un pedido."""
+    if items:
+        cursor.executemany(SQL_INSERTAR_ITEMS, [
+            (pedido_id, item['producto_id'], item['nombre'][:150], item['cantidad'], item['precio'])
+            for item in items
+        ])
+
+
+def cargar_items(cursor, pedido_ids):
+    """{pedido_id: [items]} en una sola consulta indexada por pedido_id."""
+    items = {pedido_id: [] for pedido_id in pedido_ids}
+    if not items:
+        return items
+    marcadores = ", ".join(["%s"] * len(items))
+    cursor.execute(
+        f'''SELECT pedido_id, producto_id, nombre, cantidad, precio_unitario FROM pedido_items
+        WHERE pedido_id IN ({marcadores}) ORDER BY pedido_id, id''',
+        list(items),
+    )
+    for fila in cursor.fetchall():
+        items[fila['pedido_id']].append(item_de_fila(fila))
+    return items
+
+
+def item_de_fila(fila):
+    """Item de pedido_items con las claves de validar_carrito."""
+    return {
+        'producto_id': fila['producto_id'],
+        'nombre': fila['nombre'],
+        'cantidad': fila['cantidad'],
+        'precio': float(fila['precio_unitario']),
+    }
+
+
+def rellenar_items(cursor, lote=500):
+    """Paso de migración: copia a pedido_items los items de datos_pedido, por lotes.
+
+    Los pedidos que ya tienen items (o que no tienen ninguno válido) se saltan.
+    """
+    desde, copiados = 0, 0
+    while True:
+        cursor.execute(
+            '''SELECT p.id, p.datos_pedido FROM pedidos p
+            WHERE p.id > %s AND NOT EXISTS (SELECT 1 FROM pedido_items i WHERE i.pedido_id = p.id)
+            ORDER BY p.id LIMIT %s''',
+            (desde, lote),
+        )
+        filas = cursor.fetchall()
+        if not filas:
+            return copiados
+        for pedido_id, datos_pedido in filas:
+            try:
+                items = validar_carrito(datos_pedido, requerido=False)[1]
+            except PedidoInvalido:
+                logger.warning("Pedido %s con datos_pedido ilegible: sin items", pedido_id)
+                continue
+            guardar_items(cursor, pedido_id, items)
+            copiados += len(items)
+        desde = filas[-1][0]
+
+
+def calcular_puntos(monto):
+    """1 punto cada S/10"""
+    return int(float(monto) / 10)
+
+
+def agregar_puntos(cursor, usuario_id, monto):
+    """Suma los puntos de una compra dentro de la transacción del pedido."""
+    puntos = calcular_puntos(monto)
+    if puntos:
+        cursor.execute("UPDATE usuarios SET puntos = puntos + %s WHERE id = %s", (puntos, usuario_id))
+    return puntos
+
+
+def registrar_pedido(usuario_id, cliente, datos, total):
+    """Inserta el pedido con sus items, suma los puntos y actualiza los resúmenes de ventas en una sola transacción.
+
+    ``cliente`` tiene nombre, email, telefono, direccion y metodo_pago;
+    ``datos`` es lo devuelto por validar_carrito. Devuelve (pedido_id, puntos).
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        conn.start_transaction()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO pedidos
+            (usuario_id, nombre_cliente, email_cliente, telefono_cliente,
+             direccion_cliente, metodo_pago, total, datos_pedido)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
+            (usuario_id, cliente.get('nombre') or None, cliente.get('email') or None,
+             cliente.get('telefono') or None, cliente.get('direccion') or None,
+             cliente.get('metodo_pago') or None, total, json.dumps(datos))
+        )
+        pedido_id = cursor.lastrowid
+        guardar_items(cursor, pedido_id, datos.get('items', []))
+        puntos = agregar_puntos(cursor, usuario_id, total) if usuario_id else 0
+        cursor.execute('SELECT fecha_pedido FROM pedidos WHERE id = %s', (pedido_id,))
+        acumular_pedido(cursor, cursor.fetchone()[0], datos.get('items', []), total, puntos)
+        conn.commit()
+        cursor.close()
+        return pedido_id, puntos
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        close_db_connection(conn)
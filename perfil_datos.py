@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from db import get_db_connection, close_db_connection
+from pedidos import listar_pedidos, PEDIDOS_POR_PAGINA
+
+# Hilos compartidos por todas las cargas de perfil: acota también cuántas
+# conexiones del pool pueden ocupar a la vez las consultas del perfil.
+def _crear_executor():
+    return ThreadPoolExecutor(
+        max_workers=int(os.getenv("PERFIL_CONCURRENCIA", 4)), thread_name_prefix="perfil"
+    )
+
+
+_executor = _crear_executor()
+
+
+def _reiniciar_tras_fork():
+    # Los hilos del executor no sobreviven al fork
+    global _executor
+    _executor = _crear_executor()
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def _consultar(funcion, *args):
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return funcion(cursor, *args)
+        finally:
+            cursor.close()
+    finally:
+        close_db_connection(conn)
+
+
+def _direcciones(cursor, usuario_id):
+    cursor.execute('SELECT id, alias, calle, ciudad, estado, codigo_postal, pais, es_principal FROM direcciones WHERE usuario_id = %s', (usuario_id,))
+    direcciones = cursor.fetchall()
+    for row in direcciones:
+        row['es_principal'] = bool(row['es_principal'])
+    return direcciones
+
+
+def _lista_deseos(cursor, usuario_id):
+    cursor.execute('SELECT id, producto_id, fecha_agregado FROM lista_deseos WHERE usuario_id = %s', (usuario_id,))
+    return cursor.fetchall()
+
+
+def _preferencias(cursor, usuario_id):
+    cursor.execute('SELECT email_notificaciones, sms_notificaciones, emails_promocionales FROM preferencias_notificacion WHERE usuario_id = %s', (usuario_id,))
+    pref_row = cursor.fetchone()
+    return {
+        'email_notificaciones': bool(pref_row['email_notificaciones']) if pref_row else True,
+        'sms_notificaciones': bool(pref_row['sms_notificaciones']) if pref_row else False,
+        'emails_promocionales': bool(pref_row['emails_promocionales']) if pref_row else True
+    }
+
+
+def cargar_perfil(usuario_id, antes=None, limite=PEDIDOS_POR_PAGINA):
+    """Datos de /perfil con las cuatro consultas en paralelo sobre conexiones del pool.
+
+    El tiempo total es el de la consulta más lenta en lugar de la suma de las
+    cuatro. Los pedidos vienen paginados (ver pedidos.listar_pedidos).
+    """
+    futuros = {
+        'direcciones': metrics.submit(_executor, _consultar, _direcciones, usuario_id),
+        'pedidos': metrics.submit(_executor, _consultar, listar_pedidos, usuario_id, antes, limite),
+        'lista_deseos': metrics.submit(_executor, _consultar, _lista_deseos, usuario_id),
+        'preferencias': metrics.submit(_executor, _consultar, _preferencias, usuario_id),
+    }
+    user_data = {clave: futuro.result() for clave, futuro in futuros.items()}
+    user_data['pedidos'], user_data['pedidos_siguiente'] = user_data['pedidos']
+    return user_data
@@ -0,0 +1,237 @@
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PERIODOS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# =================== Límites ===================
+class Limite:
+    """Cubeta de fichas: ``capacidad`` peticiones seguidas y luego ``capacidad`` por ``periodo``."""
+
+    __slots__ = ("capacidad", "periodo", "tasa")
+
+    def __init__(self, capacidad, periodo):
+        if capacidad <= 0 or periodo <= 0:
+            raise ValueError("El límite necesita capacidad y periodo positivos")
+        self.capacidad = capacidad
+        self.periodo = periodo
+        self.tasa = capacidad / periodo  # fichas por segundo
+
+    @classmethod
+    def parse(cls, texto):
+        """"5/m", "100/h" o "10/30" (segundos). Vacío u "off" = sin límite (None)."""
+        texto = (texto or "").strip().lower()
+        if texto in ("", "0", "off"):
+            return None
+        m = re.fullmatch(r"(\d+)\s*/\s*(\d+(?:\.\d+)?|[smhd])", texto)
+        if not m:
+            raise ValueError(f"Límite inválido: {texto!r} (usa p. ej. 5/m)")
+        periodo = PERIODOS.get(m.group(2)) or float(m.group(2))
+        return cls(int(m.group(1)), periodo)
+
+    def __repr__(self):
+        return f"Limite({self.capacidad}/{self.periodo:g}s)"
+
+
+def _consumir(entrada, limite, costo, ahora):
+    """Rellena la cubeta guardada y descuenta ``costo`` fichas si alcanzan.
+
+    ``entrada`` es (fichas, actualizado, expira) o None. Devuelve
+    (permitido, espera, nueva_entrada); ``expira`` es el instante en que la
+    cubeta vuelve a estar llena y se puede olvidar.
+    """
+    if entrada is None or entrada[2] <= ahora:
+        fichas = float(limite.capacidad)
+    else:
+        fichas = min(limite.capacidad, entrada[0] + (ahora - entrada[1]) * limite.tasa)
+    permitido = fichas >= costo
+    espera = 0.0
+    if permitido:
+        fichas -= costo
+    else:
+        espera = (costo - fichas) / limite.tasa
+    expira = ahora + (limite.capacidad - fichas) / limite.tasa
+    return permitido, espera, (fichas, ahora, expira)
+
+
+# =================== Backends ===================
+class MemoriaBackend:
+    """Cubetas en la memoria del proceso, compartidas por todos sus hilos.
+
+    Cada clave ocupa una tupla de tres floats. Las cubetas que ya se
+    rellenaron se descartan al pasar y ``max_claves`` acota la memoria aunque
+    lleguen muchas IPs distintas (se olvidan las menos recientes).
+    """
+
+    def __init__(self, max_claves=100_000):
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()  # clave -> (fichas, actualizado, expira)
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reiniciar_tras_fork)
+
+    def consumir(self, clave, limite, costo=1):
+        ahora = time.monotonic()
+        with self._lock:
+            permitido, espera, entrada = _consumir(self._cubetas.pop(clave, None), limite, costo, ahora)
+            self._cubetas[clave] = entrada
+            self._purgar(ahora)
+        return permitido, espera
+
+    def reiniciar(self, clave):
+        with self._lock:
+            self._cubetas.pop(clave, None)
+
+    def __len__(self):
+        return len(self._cubetas)
+
+    def _purgar(self, ahora, maximo=8):
+        # Las más antiguas van primero; revisar unas pocas por llamada mantiene O(1)
+        cubetas = self._cubetas
+        for _ in range(maximo):
+            if not cubetas:
+                break
+            clave, entrada = next(iter(cubetas.items()))
+            if entrada[2] > ahora:
+                break
+            del cubetas[clave]
+        while len(cubetas) > self.max_claves:
+            cubetas.popitem(last=False)
+
+    def _reiniciar_tras_fork(self):
+        # El lock pudo quedar tomado por otro hilo del proceso padre
+        self._lock = threading.Lock()
+
+
+class SQLiteBackend:
+    """Cubetas en un archivo SQLite local: las comparten todos los workers del servidor."""
+
+    def __init__(self, ruta, purgar_cada=500):
+        self.ruta = ruta
+        self.purgar_cada = purgar_cada
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        self._operaciones = 0
+        os.register_at_fork(after_in_child=self._reiniciar_tras_fork)
+
+    def _conexion(self):
+        if self._db is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            self._db = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cubetas ("
+                "clave TEXT PRIMARY KEY, fichas REAL, actualizado REAL, expira REAL)"
+            )
+            self._pid = os.getpid()
+        return self._db
+
+    def consumir(self, clave, limite, costo=1):
+        # time.time y no monotonic: el reloj tiene que ser el mismo en todos los procesos
+        ahora = time.time()
+        with self._lock:
+            db = self._conexion()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                entrada = db.execute(
+                    "SELECT fichas, actualizado, expira FROM cubetas WHERE clave = ?", (clave,)
+                ).fetchone()
+                permitido, espera, entrada = _consumir(entrada, limite, costo, ahora)
+                db.execute("INSERT OR REPLACE INTO cubetas VALUES (?, ?, ?, ?)", (clave, *entrada))
+                self._operaciones += 1
+                if self._operaciones % self.purgar_cada == 0:
+                    db.execute("DELETE FROM cubetas WHERE expira <= ?", (ahora,))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return permitido, espera
+
+    def reiniciar(self, clave):
+        with self._lock:
+            self._conexion().execute("DELETE FROM cubetas WHERE clave = ?", (clave,))
+
+    def _reiniciar_tras_fork(self):
+        # La conexión del padre no se usa en el hijo; _conexion abre otra
+        self._lock = threading.Lock()
+
+
+# =================== Flask ===================
+def por_ip():
+    return request.remote_addr
+
+
+def por_campo(nombre):
+    """Clave a partir de un campo del formulario (p. ej. el correo en /login)."""
+    def clave():
+        valor = (request.form.get(nombre) or "").strip().lower()
+        return valor[:254] or None
+    clave.__name__ = nombre
+    return clave
+
+
+class RateLimiter:
+    """Limita peticiones por ruta antes de que lleguen a la base de datos.
+
+    Cada regla es (Limite, funcion_clave); la función devuelve la IP, el
+    correo, etc. o None para no aplicar esa regla. Si alguna cubeta está
+    vacía se responde 429 con Retry-After.
+    """
+
+    def __init__(self, backend=None, enabled=True):
+        self.backend = backend if backend is not None else MemoriaBackend()
+        self.enabled = enabled
+
+    def limitar(self, *reglas, metodos=("POST",), al_exceder=None):
+        """Decorador de vistas. ``al_exceder(espera)`` arma la respuesta 429."""
+        reglas = [(limite, clave) for limite, clave in reglas if limite is not None]
+
+        def decorador(vista):
+            @wraps(vista)
+            def envoltura(*args, **kwargs):
+                if not self.enabled or request.method not in metodos:
+                    return vista(*args, **kwargs)
+                for limite, clave in reglas:
+                    valor = clave()
+                    if valor is None:
+                        continue
+                    permitido, espera = self.backend.consumir(
+                        f"{request.endpoint}:{clave.__name__}:{valor}", limite
+                    )
+                    if not permitido:
+                        return self._rechazar(request.endpoint, clave.__name__, espera, al_exceder)
+                return vista(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def reiniciar(self, endpoint, clave, valor):
+        """Vacía una cubeta (p. ej. la de la cuenta tras un login correcto)."""
+        self.backend.reiniciar(f"{endpoint}:{clave.__name__}:{valor}")
+
+    @staticmethod
+    def _rechazar(endpoint, regla, espera, al_exceder):
+        espera = max(1, math.ceil(espera))
+        metrics.registry.inc("rate_limit_rejections_total", route=endpoint, rule=regla)
+        logger.warning("Límite de peticiones excedido en %s por %s", endpoint, regla)
+        if al_exceder is not None:
+            response = make_response(al_exceder(espera), 429)
+        else:
+            response = make_response("Demasiadas solicitudes. Intenta más tarde.", 429)
+        response.headers["Retry-After"] = str(espera)
+        return response
+
+
+metrics.registry.describe("rate_limit_rejections_total", "Peticiones rechazadas por límite de frecuencia")
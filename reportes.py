@@ -0,0 +1,213 @@
+"""Reportes de ventas para administradores, leídos de tablas de resumen.
+
+    python reportes.py            # reconstruye los resúmenes desde pedidos
+
+``ventas_diarias`` y ``ventas_productos_diarias`` se actualizan en la misma
+transacción que registra cada pedido (ver pedidos.registrar_pedido), así los
+reportes nunca recorren ``pedidos``. La reconstrucción (que lee los items de
+``pedido_items``) solo hace falta si se corrigen pedidos a mano.
+"""
+import csv
+import io
+import logging
+import sys
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Items sin producto_id (carritos antiguos) se agrupan bajo este id
+SIN_PRODUCTO = 0
+
+TABLAS_RESUMEN = [
+    '''
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha DATE PRIMARY KEY,
+            pedidos INT NOT NULL DEFAULT 0,
+            articulos INT NOT NULL DEFAULT 0,
+            total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            puntos INT NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS ventas_productos_diarias (
+            fecha DATE NOT NULL,
+            producto_id INT NOT NULL,
+            nombre VARCHAR(150),
+            cantidad INT NOT NULL DEFAULT 0,
+            importe DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id),
+            INDEX idx_ventas_productos_producto (producto_id, fecha)
+        )
+    ''',
+]
+
+
+# =================== Acumulación ===================
+class Acumulado:
+    """Sumas por día y por (día, producto) antes de escribirlas en los resúmenes."""
+
+    def __init__(self):
+        self.dias = {}       # fecha -> [pedidos, articulos, total, puntos]
+        self.productos = {}  # (fecha, producto_id) -> [nombre, cantidad, importe]
+
+    def agregar(self, fecha, items, total, puntos):
+        dia = self.dias.setdefault(fecha, [0, 0, 0.0, 0])
+        dia[0] += 1
+        dia[2] += float(total or 0)
+        dia[3] += puntos
+        for item in items:
+            dia[1] += item['cantidad']
+            clave = (fecha, item['producto_id'] or SIN_PRODUCTO)
+            producto = self.productos.setdefault(clave, [item['nombre'], 0, 0.0])
+            producto[1] += item['cantidad']
+            producto[2] += item['cantidad'] * item['precio']
+
+    def escribir(self, cursor):
+        if self.dias:
+            cursor.executemany(
+                '''INSERT INTO ventas_diarias (fecha, pedidos, articulos, total, puntos)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE pedidos = pedidos + VALUES(pedidos),
+                    articulos = articulos + VALUES(articulos),
+                    total = total + VALUES(total), puntos = puntos + VALUES(puntos)''',
+                [(fecha, p, a, round(t, 2), pts) for fecha, (p, a, t, pts) in self.dias.items()],
+            )
+        if self.productos:
+            cursor.executemany(
+                '''INSERT INTO ventas_productos_diarias (fecha, producto_id, nombre, cantidad, importe)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE nombre = VALUES(nombre),
+                    cantidad = cantidad + VALUES(cantidad), importe = importe + VALUES(importe)''',
+                [(fecha, pid, nombre, c, round(i, 2))
+                 for (fecha, pid), (nombre, c, i) in self.productos.items()],
+            )
+
+
+def dia(fecha_pedido):
+    """Día de ``fecha_pedido`` tal como lo guardó MySQL (no el reloj de la app)."""
+    return fecha_pedido.date() if isinstance(fecha_pedido, datetime) else fecha_pedido
+
+
+def acumular_pedido(cursor, fecha_pedido, items, total, puntos):
+    """Suma un pedido a los resúmenes; se llama dentro de la transacción del pedido.
+
+    ``fecha_pedido`` es la de la fila insertada, así el día coincide con el
+    que usa ``reconstruir`` aunque la app y MySQL estén en otra zona horaria.
+    """
+    acumulado = Acumulado()
+    acumulado.agregar(dia(fecha_pedido), items, total, puntos)
+    acumulado.escribir(cursor)
+
+
+def reconstruir(get_connection, close_connection, lote=500):
+    """Vacía los resúmenes y los recalcula leyendo pedidos por lotes.
+
+    Los pedidos nuevos que llegan mientras tanto (id mayor que el último al
+    empezar) ya se suman solos, así que no se cuentan dos veces.
+    """
+    from pedidos import calcular_puntos, cargar_items
+
+    conn = get_connection()
+    if conn is None:
+        raise ConnectionError("Sin conexión a la base de datos")
+    try:
+        conn.start_transaction()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("DELETE FROM ventas_productos_diarias")
+        cursor.execute("DELETE FROM ventas_diarias")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS ultimo FROM pedidos")
+        ultimo = cursor.fetchone()['ultimo']
+        conn.commit()
+
+        desde, procesados = 0, 0
+        while True:
+            cursor.execute(
+                '''SELECT id, usuario_id, fecha_pedido, total FROM pedidos
+                WHERE id > %s AND id <= %s ORDER BY id LIMIT %s''',
+                (desde, ultimo, lote),
+            )
+            filas = cursor.fetchall()
+            if not filas:
+                break
+            items = cargar_items(cursor, [fila['id'] for fila in filas])
+            acumulado = Acumulado()
+            for fila in filas:
+                puntos = calcular_puntos(fila['total'] or 0) if fila['usuario_id'] else 0
+                acumulado.agregar(dia(fila['fecha_pedido']), items[fila['id']], fila['total'], puntos)
+            acumulado.escribir(cursor)
+            conn.commit()
+            desde = filas[-1]['id']
+            procesados += len(filas)
+        cursor.close()
+        logger.info("Resúmenes de ventas reconstruidos con %s pedidos", procesados)
+        return procesados
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        close_connection(conn)
+
+
+# =================== Consultas del panel ===================
+def totales(cursor, desde, hasta):
+    cursor.execute(
+        '''SELECT COALESCE(SUM(pedidos), 0) AS pedidos, COALESCE(SUM(articulos), 0) AS articulos,
+                  COALESCE(SUM(total), 0) AS total, COALESCE(SUM(puntos), 0) AS puntos
+        FROM ventas_diarias WHERE fecha BETWEEN %s AND %s''',
+        (desde, hasta),
+    )
+    return cursor.fetchone()
+
+
+def ventas_por_dia(cursor, desde, hasta, limite=None, offset=0):
+    """Días del rango, del más reciente al más antiguo (sin ``limite``: todos)."""
+    sql = '''SELECT fecha, pedidos, articulos, total, puntos FROM ventas_diarias
+        WHERE fecha BETWEEN %s AND %s ORDER BY fecha DESC'''
+    params = (desde, hasta)
+    if limite is not None:
+        sql += " LIMIT %s OFFSET %s"
+        params += (limite, offset)
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def contar_dias(cursor, desde, hasta):
+    cursor.execute("SELECT COUNT(*) AS dias FROM ventas_diarias WHERE fecha BETWEEN %s AND %s", (desde, hasta))
+    return cursor.fetchone()['dias']
+
+
+def productos_mas_vendidos(cursor, desde, hasta, limite=None):
+    sql = '''SELECT producto_id, MAX(nombre) AS nombre, SUM(cantidad) AS cantidad, SUM(importe) AS importe
+        FROM ventas_productos_diarias WHERE fecha BETWEEN %s AND %s
+        GROUP BY producto_id ORDER BY cantidad DESC, producto_id'''
+    params = (desde, hasta)
+    if limite is not None:
+        sql += " LIMIT %s"
+        params += (limite,)
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def filas_csv(columnas, filas):
+    """CSV línea a línea para respuestas en streaming."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow([fila[c] for c in columnas])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from db import close_db_connection, get_db_connection
+    print(f"✔ {reconstruir(get_db_connection, close_db_connection)} pedidos procesados")
+    sys.exit(0)
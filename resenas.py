@@ -0,0 +1,164 @@
+"""Reseñas de productos con calificación acumulada.
+
+``calificaciones_productos`` guarda por producto cuántas reseñas hay y la suma
+de sus calificaciones; se actualiza en la misma transacción que cada reseña,
+así mostrar el promedio nunca recorre ``resenas`` con AVG().
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+CALIFICACION_MIN, CALIFICACION_MAX = 1, 5
+MAX_COMENTARIO = 2000
+RESENAS_POR_PAGINA = 10
+
+# Errores de MySQL que deja la carrera de dos primeras reseñas simultáneas
+# del mismo usuario: el SELECT ... FOR UPDATE de una fila que aún no existe
+# solo bloquea el hueco y ambas llegan al INSERT
+ER_DUP_ENTRY, ER_LOCK_DEADLOCK = 1062, 1213
+
+TABLA_CALIFICACIONES = '''
+    CREATE TABLE IF NOT EXISTS calificaciones_productos (
+        producto_id INT PRIMARY KEY,
+        resenas INT NOT NULL DEFAULT 0,
+        suma INT NOT NULL DEFAULT 0
+    )
+'''
+
+
+class ResenaInvalida(ValueError):
+    """Calificación o comentario que no se pueden guardar."""
+
+
+def validar(calificacion, comentario):
+    try:
+        calificacion = int(calificacion)
+    except (TypeError, ValueError):
+        raise ResenaInvalida("Calificación inválida")
+    if not CALIFICACION_MIN <= calificacion <= CALIFICACION_MAX:
+        raise ResenaInvalida(f"La calificación va de {CALIFICACION_MIN} a {CALIFICACION_MAX}")
+    comentario = str(comentario or "").strip()
+    if len(comentario) > MAX_COMENTARIO:
+        raise ResenaInvalida(f"El comentario admite como máximo {MAX_COMENTARIO} caracteres")
+    return calificacion, comentario or None
+
+
+def recalcular(cursor):
+    """Rellena los acumulados desde ``resenas`` (paso de migración)."""
+    cursor.execute(
+        '''INSERT INTO calificaciones_productos (producto_id, resenas, suma)
+        SELECT producto_id, COUNT(*), SUM(calificacion) FROM resenas GROUP BY producto_id
+        ON DUPLICATE KEY UPDATE resenas = VALUES(resenas), suma = VALUES(suma)'''
+    )
+
+
+# =================== Escritura ===================
+def _acumular(cursor, producto_id, resenas, suma):
+    cursor.execute(
+        '''INSERT INTO calificaciones_productos (producto_id, resenas, suma) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE resenas = resenas + VALUES(resenas), suma = suma + VALUES(suma)''',
+        (producto_id, resenas, suma),
+    )
+
+
+def _guardar(conn, usuario_id, producto_id, calificacion, comentario):
+    conn.start_transaction()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, calificacion FROM resenas WHERE usuario_id = %s AND producto_id = %s FOR UPDATE",
+        (usuario_id, producto_id),
+    )
+    anterior = cursor.fetchone()
+    if anterior:
+        cursor.execute(
+            "UPDATE resenas SET calificacion = %s, comentario = %s WHERE id = %s",
+            (calificacion, comentario, anterior[0]),
+        )
+        _acumular(cursor, producto_id, 0, calificacion - anterior[1])
+    else:
+        cursor.execute(
+            "INSERT INTO resenas (usuario_id, producto_id, calificacion, comentario) VALUES (%s, %s, %s, %s)",
+            (usuario_id, producto_id, calificacion, comentario),
+        )
+        _acumular(cursor, producto_id, 1, calificacion)
+    conn.commit()
+    cursor.close()
+    return anterior is None
+
+
+def guardar_resena(conn, usuario_id, producto_id, calificacion, comentario):
+    """Crea o reemplaza la reseña del usuario y ajusta el acumulado del producto.
+
+    Devuelve True si la reseña es nueva. Si otra petición creó la misma
+    reseña a la vez (clave duplicada o deadlock), se reintenta una vez: la
+    fila ya existe y se actualiza.
+    """
+    calificacion, comentario = validar(calificacion, comentario)
+    for intento in range(2):
+        try:
+            return _guardar(conn, usuario_id, producto_id, calificacion, comentario)
+        except Exception as e:
+            conn.rollback()
+            if intento or getattr(e, "errno", None) not in (ER_DUP_ENTRY, ER_LOCK_DEADLOCK):
+                raise
+            logger.info("Reseña de usuario %s en producto %s creada a la vez, se reintenta", usuario_id, producto_id)
+
+
+def eliminar_resena(conn, usuario_id, producto_id):
+    """Borra la reseña del usuario; devuelve False si no tenía."""
+    try:
+        conn.start_transaction()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, calificacion FROM resenas WHERE usuario_id = %s AND producto_id = %s FOR UPDATE",
+            (usuario_id, producto_id),
+        )
+        anterior = cursor.fetchone()
+        if anterior:
+            cursor.execute("DELETE FROM resenas WHERE id = %s", (anterior[0],))
+            _acumular(cursor, producto_id, -1, -anterior[1])
+        conn.commit()
+        cursor.close()
+        return anterior is not None
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# =================== Lectura ===================
+def _resumen(resenas, suma):
+    return {'resenas': resenas, 'promedio': round(suma / resenas, 2) if resenas else None}
+
+
+def calificaciones(cursor, producto_ids):
+    """{producto_id: {'resenas', 'promedio'}} en una sola consulta; sin reseñas, 0 y None."""
+    ids = sorted(set(producto_ids))
+    resultado = {pid: _resumen(0, 0) for pid in ids}
+    if ids:
+        marcas = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT producto_id, resenas, suma FROM calificaciones_productos WHERE producto_id IN ({marcas})",
+            ids,
+        )
+        for fila in cursor.fetchall():
+            resultado[fila['producto_id']] = _resumen(fila['resenas'], fila['suma'])
+    return resultado
+
+
+def listar_resenas(cursor, producto_id, antes=None, limite=RESENAS_POR_PAGINA):
+    """Una página de reseñas, de la más reciente a la más antigua.
+
+    ``antes`` es el id de la última reseña de la página anterior. Devuelve
+    (resenas, siguiente); ``siguiente`` es None en la última página.
+    """
+    sql = 'SELECT id, calificacion, comentario, fecha_creacion FROM resenas WHERE producto_id = %s'
+    params = [producto_id]
+    if antes:
+        sql += ' AND id < %s'
+        params.append(antes)
+    sql += ' ORDER BY id DESC LIMIT %s'
+    params.append(limite + 1)
+    cursor.execute(sql, params)
+    filas = cursor.fetchall()
+    siguiente = filas[limite - 1]['id'] if len(filas) > limite else None
+    return filas[:limite], siguiente
@@ -0,0 +1,187 @@
+import itertools
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TunnelUnavailableError(Exception):
+    """Ningún canal del túnel SSH está activo en este momento."""
+
+
+def ssh_forwarder_factory():
+    """Crea un SSHTunnelForwarder con los datos del .env (un canal = una sesión SSH)."""
+    from sshtunnel import SSHTunnelForwarder
+
+    return SSHTunnelForwarder(
+        (os.getenv("SSH_HOST"), int(os.getenv("SSH_PORT"))),
+        ssh_username=os.getenv("SSH_USER"),
+        ssh_private_key=os.getenv("SSH_KEY_PATH"),
+        remote_bind_address=(os.getenv("DB_HOST"), int(os.getenv("DB_PORT"))),
+        local_bind_address=("127.0.0.1", 0),  # Puerto local automático
+        set_keepalive=float(os.getenv("SSH_KEEPALIVE", 30)),
+    )
+
+
+def tcp_probe(port, timeout=2.0):
+    """Comprueba que el puerto local del túnel acepta conexiones."""
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class _Channel:
+    def __init__(self, index):
+        self.index = index
+        self.forwarder = None
+        self.failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def active(self):
+        return self.forwarder is not None and self.forwarder.is_active
+
+
+class TunnelSupervisor:
+    """Mantiene vivos uno o varios túneles SSH hacia MySQL.
+
+    ``forwarder_factory`` devuelve un objeto con ``start()``, ``stop()``,
+    ``is_active`` y ``local_bind_port`` (SSHTunnelForwarder en producción,
+    cualquier objeto equivalente en pruebas). Cada canal es un forwarder
+    independiente; ``endpoint()`` los reparte en round-robin.
+
+    Un hilo en segundo plano revisa cada ``health_interval`` segundos que los
+    canales sigan activos y reabre los caídos con backoff exponencial. Tras
+    cada reapertura se llama a los listeners registrados con
+    ``add_restart_listener`` (el pool los usa para descartar sockets viejos).
+    """
+
+    def __init__(self, forwarder_factory, channels=1, health_interval=15.0,
+                 backoff_base=1.0, backoff_max=60.0, probe=tcp_probe):
+        self._factory = forwarder_factory
+        self._channels = [_Channel(i) for i in range(max(1, channels))]
+        self.health_interval = health_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._probe = probe
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._monitor = None
+        self._started = False
+
+    # ---------- API pública ----------
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._stop.clear()
+            for channel in self._channels:
+                self._open(channel)
+            self._monitor = threading.Thread(target=self._run, name="ssh-tunnel-supervisor", daemon=True)
+            self._monitor.start()
+
+    def stop(self):
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            self._stop.set()
+            for channel in self._channels:
+                self._close(channel)
+        if self._monitor is not None and self._monitor is not threading.current_thread():
+            self._monitor.join(timeout=5)
+        self._monitor = None
+
+    def endpoint(self):
+        """Devuelve (host, puerto) local de un canal activo."""
+        if not self._started:
+            self.start()
+        activos = [c for c in self._channels if c.active]
+        if not activos:
+            raise TunnelUnavailableError("Túnel SSH no disponible")
+        channel = activos[next(self._rr) % len(activos)]
+        return "127.0.0.1", channel.forwarder.local_bind_port
+
+    def add_restart_listener(self, callback):
+        self._listeners.append(callback)
+
+    def check_now(self):
+        """Ejecuta una ronda de health checks (la usa el hilo supervisor)."""
+        reiniciados = []
+        with self._lock:
+            if not self._started:
+                return
+            ahora = time.monotonic()
+            for channel in self._channels:
+                if self._healthy(channel) or ahora < channel.retry_at:
+                    continue
+                self._close(channel)
+                if self._open(channel):
+                    reiniciados.append(channel.index)
+        for index in reiniciados:
+            self._notify(index)
+
+    def status(self):
+        return [
+            {
+                "channel": c.index,
+                "active": c.active,
+                "port": c.forwarder.local_bind_port if c.active else None,
+                "failures": c.failures,
+            }
+            for c in self._channels
+        ]
+
+    # ---------- Internos ----------
+    def _run(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_now()
+            except Exception:
+                logger.exception("Error supervisando túnel SSH")
+
+    def _healthy(self, channel):
+        if not channel.active:
+            return False
+        return self._probe is None or self._probe(channel.forwarder.local_bind_port)
+
+    def _open(self, channel):
+        try:
+            forwarder = self._factory()
+            forwarder.start()
+        except Exception as e:
+            channel.failures += 1
+            espera = min(self.backoff_max, self.backoff_base * 2 ** (channel.failures - 1))
+            channel.retry_at = time.monotonic() + espera * random.uniform(0.5, 1.0)
+            logger.warning("Túnel SSH canal %s caído (intento %s): %s", channel.index, channel.failures, e)
+            return False
+        channel.forwarder = forwarder
+        channel.failures = 0
+        channel.retry_at = 0.0
+        logger.info("Túnel SSH canal %s activo en puerto %s", channel.index, forwarder.local_bind_port)
+        return True
+
+    @staticmethod
+    def _close(channel):
+        forwarder, channel.forwarder = channel.forwarder, None
+        if forwarder is not None:
+            try:
+                forwarder.stop()
+            except Exception:
+                pass
+
+    def _notify(self, index):
+        for callback in self._listeners:
+            try:
+                callback(index)
+            except Exception:
+                logger.exception("Error notificando reinicio del túnel")
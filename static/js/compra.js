@@ -1,484 +1,28 @@
-// Base de datos de productos por categoría
-const productsByCategory = {
-    inicio: [  // FERTILIZANTES INICIO Y PRE-FLORACIÓN
-        { 
-            id: 1, 
-            name: "Poly-Feed 8-52-1", 
-            category: "FERTILIZANTES INICIO Y PRE-FLORACIÓN", 
-            price: 45.99,
-            // ¡IMPORTANTE! El archivo en la imagen se llama poly-feed.jpeg, pero el ID 1 usa poly-feed-8-52-17.jpg. 
-            // Usaré el nombre del JS, pero podrías tener que renombrar tu archivo.
-            image: "poly-feed-8-52-1.png" 
-        },
-    ],
-    fosfatados: [
-        { 
-            id: 2, 
-            name: "Fosfato Diamónico", 
-            category: "FERTILIZANTES FOSFATADOS", 
-            price: 45.99,
-            image: "fosfatodiamonico.png" // Usando fosfato.png de la estructura de carpetas
-        },
-        { 
-            id: 3, 
-            name: "Superfosfato Triple", 
-            category: "FERTILIZANTES FOSFATADOS", 
-            price: 38.50,
-            image: "super-fosfato-triple-.png" // Usando 3.jpg de la estructura de carpetas
-        },
-        { 
-            id: 4, 
-            name: "Fosfato Monoamónico Granular", 
-            category: "FERTILIZANTES FOSFATADOS", 
-            price: 52.75,
-            image: "fosfatogranular.png" // Usando 5.jpg de la estructura de carpetas
-        },
-        { 
-            id: 5, 
-            name: "MicroEssentials SZ", 
-            category: "FERTILIZANTES FOSFATADOS", 
-            price: 52.75,
-            image: "microessential.png" // Usando 5.jpg de la estructura de carpetas
-        }
-        
-    ],
-    vegetativo: [  // DESARROLLO VEGETATIVO
-        { 
-            id: 6, 
-            name: "Poly-Feed-31-11-11", 
-            category: "DESARROLLO VEGETATIVO", 
-            price: 35.99,
-            image: "poly-feed-31-11-11.png" // Ejemplo de uso
-        }
-    ],
-    potasicos: [
-        { 
-            id: 7, 
-            name: "Cloruro de Potasio", 
-            category: "FERTILIZANTES POTÁSICOS", 
-            price: 29.80,
-            image: "cloruropotasio.png"
-        },
-        { 
-            id: 8, 
-            name: "Sulfato de Potasio", 
-            category: "FERTILIZANTES POTÁSICOS", 
-            price: 55.40,
-            image: "sulfatopotasio.png"
-        },
-        { 
-            id: 9, 
-            name: "Nitrato de Potasio Perlado", 
-            category: "FERTILIZANTES POTÁSICOS", 
-            price: 55.40,
-            image: "nitratopotasio.png"
-        },
-        { 
-            id: 10, 
-            name: "Cloruro Potásico Blanco", 
-            category: "FERTILIZANTES GENÉRICOS", 
-            price: 55.40,
-            image: "cloruropotasioblanco.png"
-        }
-    ],
-    multiproposito: [
-        { 
-            id: 11, 
-            name: "Poly-Feed 21-21-21", 
-            category: "MULTIPROPÓSITO", 
-            price: 32.99,
-            image: "poly-feed2121.png"
-        },
-        { 
-            id: 12, 
-            name: "Haifa Mag Enverdecedor", 
-            category: "MULTIPROPÓSITO", 
-            price: 35.75,
-            image: "haifamag.png" // Ejemplo de uso
-        }
-    ],
-    magnesicos: [
-        { 
-            id: 13, 
-            name: "K-Mag / Sulpomag", 
-            category: "FERTILIZANTES MAGNÉSICOS", 
-            price: 25.99,
-            image: "k-magsulpomag.png" // Ejemplo de uso
-        },
-        { 
-            id: 14, 
-            name: "Kieserita (Sulfato de Magnesio)", 
-            category: "FERTILIZANTES MAGNÉSICOS", 
-            price: 28.75,
-            image: "kieseritaweb.png" // Ejemplo de uso
-        }
-    ],
-    fruto: [  // DESARROLLO Y LLENADO DE FRUTO
-        { 
-            id: 15, 
-            name: "Poly-Feed 12-6-40", 
-            category: "DESARROLLO Y LLENADO DE FRUTO", 
-            price: 44.99,
-            image: "polyfeed12.png" // Ejemplo de uso
-        },
-        { 
-            id: 16, 
-            name: "Poly-Feed 15-15-30", 
-            category: "DESARROLLO Y LLENADO DE FRUTO", 
-            price: 47.25,
-            image: "poly-feed1515.png" // Ejemplo de uso
-        },
-        { 
-            id: 17, 
-            name: "Bonus-npK", 
-            category: "DESARROLLO Y LLENADO DE FRUTO", 
-            price: 47.25,
-            image: "Bonusnpk13.png" // Ejemplo de uso
-        },
-        { 
-            id: 18, 
-            name: "K-Leaf Sulfato de Potasio Foliar", 
-            category: "DESARROLLO Y LLENADO DE FRUTO", 
-            price: 47.25,
-            image: "kleafsulfato.png" // Ejemplo de uso
-        }
-    ],
-    micronutrientes: [
-        { 
-            id: 19, 
-            name: "Fertibagra 15G", 
-            category: "MICRONUTRIENTES", 
-            price: 28.99,
-            image: "Fertibagra15.png" // Ejemplo de uso
-        },
-        { 
-            id: 20, 
-            name: "F727G", 
-            category: "MICRONUTRIENTES", 
-            price: 34.50,
-            image: "F727g.png" // Ejemplo de uso
-        }
-    ],
-    compuestos: [
-        { 
-            id: 21, 
-            name: "Molimax Superdoce", 
-            category: "Mezclas Molimax", 
-            price: 43.99,
-            image: "molimaxsuperdoceM.png" // Ejemplo de uso
-        },
-        { 
-            id: 22, 
-            name: "Molimax - S", 
-            category: "FERTILIZANTES COMPUESTOS", 
-            price: 39.50,
-            image: "molimax-s.png" // Ejemplo de uso
-        },
-        { 
-            id: 23, 
-            name: "Molimax 20-20-20", 
-            category: "FERTILIZANTES MOLIMAX", 
-            price: 39.50,
-            image: "molimax202020.png" // Ejemplo de uso
-        },
-        { 
-            id: 24, 
-            name: "Molimax 12-12-12", 
-            category: "FERTILIZANTES MOLIMAX", 
-            price: 39.50,
-            image: "molimax121212.png" // Ejemplo de uso
-        },
-        { 
-            id: 25, 
-            name: "Molimax Café", 
-            category: "Mezclas especificas", 
-            price: 39.50,
-            image: "molimaxcafe.png" // Ejemplo de uso
-        },
-        { 
-            id: 26, 
-            name: "NPK café", 
-            category: "MESZCLAS ESPECÍFICAS", 
-            price: 39.50,
-            image: "npkcafe.png" // Ejemplo de uso
-        },
-        { 
-            id: 27, 
-            name: "Molimax Papa Sierra", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 39.50,
-            image: "molimaxpapasierra.png" // Ejemplo de uso
-        },
-        { 
-            id: 28, 
-            name: "Molimax Frutales", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 39.50,
-            image: "molimaxfrutales.png" // Ejemplo de uso
-        },
-        { 
-            id: 29, 
-            name: "Molimax Maíz", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 39.50,
-            image: "molimaxmaiz.png" // Ejemplo de uso
-        },
-        { 
-            id: 30, 
-            name: "Molimax Olivo", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 39.50,
-            image: "molimaxolivo.png" // Ejemplo de uso
-        },
-        { 
-            id: 31, 
-            name: "Molimax Maíz Gigante", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 39.50,
-            image: "molimaxmaizgigante.png" // Ejemplo de uso
-        },
-        { 
-            id: 32, 
-            name: "NPK Palma Aceitera", 
-            category: "FERTILIZANTES COMPUESTOS", 
-            price: 39.50,
-            image: "npkpalmaaceitera.png" // Ejemplo de uso
-        }
-    ],
-    molinax: [
-        { 
-            id: 33, 
-            name: "Molimax Superdoce", 
-            category: "MEZCLAS MOLIMAX", 
-            price: 52.99,
-            image: "molimaxsuperdoceM.png" 
-        },
-        { 
-            id: 34, 
-            name: "Molimax - S", 
-            category: "MEZCLAS MOLIMAX", 
-            price: 58.75,
-            image: "molimax-s.png"
-        },
-        { 
-            id: 35, 
-            name: "Molimax 20-20-20", 
-            category: "MEZCLAS MOLIMAX", 
-            price: 58.75,
-            image: "molimax202020.png"
-        },
-        { 
-            id: 36, 
-            name: "Molimax 12-12-12", 
-            category: "MEZCLAS MOLIMAX", 
-            price: 58.75,
-            image: "molimax121212.png"
-        }
-    ],
-    especificas: [
-        { 
-            id: 35, 
-            name: "Molimax Café", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 47.99,
-            image: "molimaxcafe.png"
-        },
-        { 
-            id: 36, 
-            name: "NPK café", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 44.50,
-            image: "npkcafe.png"
-        },
-        { 
-            id: 36, 
-            name: " Molimax Papa Sierra", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 44.50,
-            image: "molimaxpapasierra.png"
-        },
-        { 
-            id: 36, 
-            name: "Molimax Frutales", 
-            category: "MEZCLAS ESPECÍFICAS", 
-            price: 44.50,
-            image: "molimaxfrutales.png"
-        }
-    ],
-    quimicas: [
-        { 
-            id: 37, 
-            name: "Moli - 19", 
-            category: "MEZCLAS QUÍMICAS Y FORMULACIONES", 
-            price: 55.99,
-            image: "moli-19.png"
-        },
-        { 
-            id: 38, 
-            name: "Moli - 16", 
-            category: "MEZCLAS QUÍMICAS Y FORMULACIONES", 
-            price: 62.50,
-            image: "moli-16.png"
-        }
-    ],
-    hidrosolubles: [
-        { 
-            id: 39, 
-            name: "PONI", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 36.99,
-            image: "poni.png"
-        },
-        { 
-            id: 40, 
-            name: "Multi-K pHast", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "multi-kphast.png"
-        },
-        { 
-            id: 41, 
-            name: "Haifa Mag", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "haifamag.png"
-        },
-        { 
-            id: 42, 
-            name: "Haifa MKP", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "haifamkp.png"
-        },
-        { 
-            id: 43, 
-            name: "Nitrato de Calcio", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "nitratodecalcio.png"
-        },
-        { 
-            id: 44, 
-            name: "Fosfato Monoamónico Soluble", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "fosfatomonoamonico.png"
-        },
-        { 
-            id: 45, 
-            name: "Ácido Fosfórico 85%", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "acidofosforico85%.png"
-        },
-        { 
-            id: 46, 
-            name: "SOLUPOTASSE", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "solupotasse.png"
-        },
-        { 
-            id: 47, 
-            name: "Sulfato de Magnesio", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "sulfatodemagnesioH.png"
-        },
-        { 
-            id: 48, 
-            name: "Sulfato de Zinc", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "sulfatodezinc.png"
-        },
-        { 
-            id: 49, 
-            name: "Sulfato de Cobre", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "SULFATO-DE-COBREO-PENTAHIDRATADO.png"
-        },
-        { 
-            id: 50, 
-            name: "Multi-Micro Comb", 
-            category: "FERTILIZANTES HIDROSOLUBLES", 
-            price: 41.25,
-            image: "MULTI-MICRO-COMB-.png"
-        }
-    ],
-    foliares: [
-        { 
-            id: 51, 
-            name: "Poly-Feed 8-52-17", 
-            category: "FERTILIZANTES FOLIARES", 
-            price: 29.99,
-            image: "poly-feed-8-52-1.png"
-        },
-        { 
-            id: 52, 
-            name: "Poly-Feed 31-11-11", 
-            category: "FERTILIZANTES FOLIARES", 
-            price: 33.75,
-            image: "poly-feed-31-11-11.png"
-        },
-        { 
-            id: 53, 
-            name: "Poly-Feed 21-21-21", 
-            category: "FERTILIZANTES FOLIARES", 
-            price: 33.75,
-            image: "poly-feed2121.png"
-        },
-        { 
-            id: 54, 
-            name: "Poly-Feed 12-6-40", 
-            category: "FERTILIZANTES FOLIARES", 
-            price: 33.75,
-            image: "polyfeed12.png"
-        }
-    ],
-    nitrogenados: [
-        { 
-            id: 55, 
-            name: "Urea Agrícola", 
-            category: "FERTILIZANTES NITROGENADOS", 
-            price: 35.90,
-            image: "ureaagricola.png"
-        },
-        { 
-            id: 56, 
-            name: "Nitrato de Amonio", 
-            category: "FERTILIZANTES NITROGENADOS", 
-            price: 48.60,
-            image: "nitratodeamonio.png"
-        },
-        { 
-            id: 57, 
-            name: "Sulfato de Amonio", 
-            category: "FERTILIZANTES NITROGENADOS", 
-            price: 48.60,
-            image: "sulfatodeamonio.png"
-        },
-        { 
-            id: 58, 
-            name: " Molimax Nitros", 
-            category: "FERTILIZANTES NITROGENADOS", 
-            price: 48.60,
-            image: "molimaxnitros.png"
-        },
-        { 
-            id: 59, 
-            name: " Urea Azulada", 
-            category: "FERTILIZANTES NITROGENADOS", 
-            price: 48.60,
-            image: "ureaazulada.png"
-        }
-    ]
-};
+// Catálogo de productos: se consulta al servidor (/api/productos) y se guarda
+// en memoria lo ya descargado para no repetir peticiones.
+const productCache = new Map();   // id -> producto
+const categoryCache = new Map();  // categoría -> [productos]
+
+// Adaptar el formato del API al que usa la interfaz
+function toProduct(p) {
+    return { id: p.id, name: p.nombre, category: p.categoria_nombre, price: p.precio, image: p.imagen, thumbnail: p.miniatura };
+}
+
+async function fetchProducts(params) {
+    const response = await fetch(`/api/productos?${new URLSearchParams(params)}`);
+    if (!response.ok) {
+        throw new Error(`Error ${response.status} consultando productos`);
+    }
+    const data = await response.json();
+    const products = data.productos.map(toProduct);
+    products.forEach(product => productCache.set(product.id, product));
+    return products;
+}
 
 // Variables globales
 let currentCategory = 'fosfatados';
 let cart = [];
+let cartTotal = 0;
 
 // Ruta base para las imágenes (ajustada a la estructura de carpetas 'static/img')
 const IMAGE_BASE_PATH = 'static/img/';
@@ -496,86 +40,104 @@ function getImagePath(imageFileName) {
 
 // ========== SISTEMA DEL CARRITO ==========
 
-// Función para inicializar el carrito desde localStorage
-function initializeCartFromStorage() {
+// El carrito vive en el servidor (/api/carrito): aquí solo se guarda la última
+// respuesta, con precios y total calculados con el catálogo.
+function toCartItem(item) {
+    return {
+        id: item.producto_id,
+        name: item.nombre,
+        price: item.precio,
+        quantity: item.cantidad,
+        subtotal: item.subtotal,
+        image: item.imagen,
+        thumbnail: item.miniatura
+    };
+}
+
+async function cartRequest(method, url, body) {
+    const options = { method: method, headers: {} };
+    if (body !== undefined) {
+        options.headers['Content-Type'] = 'application/json';
+        options.body = JSON.stringify(body);
+    }
+    const response = await fetch(url, options);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Error ${response.status} en el carrito`);
+    }
+    cart = data.items.map(toCartItem);
+    cartTotal = data.total;
+    return cart;
+}
+
+// Función para cargar el carrito desde el servidor
+async function loadCart() {
     try {
+        // Carritos guardados por la versión anterior en localStorage: se pasan
+        // una vez al servidor y se borran
         const savedCart = localStorage.getItem('cart');
-        console.log('📦 Carrito guardado en localStorage:', savedCart);
-        
         if (savedCart) {
-            cart = JSON.parse(savedCart);
-            console.log('🛒 Carrito cargado desde localStorage:', cart);
-        } else {
-            cart = [];
-            console.log('🛒 Carrito inicializado vacío');
+            localStorage.removeItem('cart');
+            for (const item of JSON.parse(savedCart)) {
+                await cartRequest('POST', '/api/carrito/items', { producto_id: item.id, cantidad: item.quantity });
+            }
         }
+        await cartRequest('GET', '/api/carrito');
+        console.log('🛒 Carrito cargado desde el servidor:', cart);
     } catch (error) {
         console.error('❌ Error al cargar el carrito:', error);
         cart = [];
+        cartTotal = 0;
     }
+    return cart;
 }
 
-// Función para agregar producto al carrito
-function addToCart(id, name, price) {
-    console.log('🔄 Intentando agregar producto:', { id, name, price });
-    
-    // Verificar si el producto ya está en el carrito
-    const existingItemIndex = cart.findIndex(item => item.id == id);
-    
-    if (existingItemIndex !== -1) {
-        // Si ya existe, aumentar la cantidad
-        cart[existingItemIndex].quantity += 1;
-        console.log('📈 Producto existente, cantidad aumentada:', cart[existingItemIndex]);
-    } else {
-        // Si no existe, agregar nuevo producto
-        cart.push({
-            id: id,
-            name: name,
-            price: price,
-            quantity: 1
-        });
-        console.log('🆕 Nuevo producto agregado:', cart[cart.length - 1]);
-    }
-    
-    // Guardar en localStorage
-    localStorage.setItem('cart', JSON.stringify(cart));
-    console.log('💾 Carrito guardado en localStorage:', cart);
-    
-    // Actualizar interfaz
+function refreshCart() {
     updateCartCount();
     updateCartModal();
-    
-    // Mostrar notificación
+}
+
+// Función para agregar producto al carrito
+async function addToCart(id, name, price) {
+    console.log('🔄 Intentando agregar producto:', { id, name });
+    try {
+        await cartRequest('POST', '/api/carrito/items', { producto_id: id, cantidad: 1 });
+    } catch (error) {
+        console.error('❌ Error al agregar producto:', error);
+        showNotification(`⚠️ ${error.message}`);
+        return;
+    }
+    refreshCart();
     showNotification(`✅ ${name} añadido al carrito`);
 }
 
 // Función para eliminar producto del carrito
-function removeFromCart(index) {
+async function removeFromCart(index) {
     console.log('🗑️ Eliminando producto del índice:', index);
-    cart.splice(index, 1);
-    localStorage.setItem('cart', JSON.stringify(cart));
-    updateCartModal();
-    updateCartCount();
+    if (index < 0 || index >= cart.length) return;
+    try {
+        await cartRequest('DELETE', `/api/carrito/items/${cart[index].id}`);
+    } catch (error) {
+        console.error('❌ Error al eliminar producto:', error);
+    }
+    refreshCart();
 }
 
 // Función para actualizar cantidad
-function updateQuantity(index, change) {
+async function updateQuantity(index, change) {
     console.log('🔢 Actualizando cantidad:', { index, change });
-    // Asegurarse de que el índice es válido
-    if (index >= 0 && index < cart.length) {
-        cart[index].quantity += change;
-        
-        if (cart[index].quantity <= 0) {
-            // Eliminar si la cantidad llega a 0 o menos
-            cart.splice(index, 1);
-        }
-        
-        localStorage.setItem('cart', JSON.stringify(cart));
-        updateCartModal();
-        updateCartCount();
-    } else {
+    if (index < 0 || index >= cart.length) {
         console.error('❌ Índice de carrito inválido:', index);
+        return;
     }
+    // Cantidad 0 o menos elimina el producto
+    const quantity = Math.max(cart[index].quantity + change, 0);
+    try {
+        await cartRequest('PUT', `/api/carrito/items/${cart[index].id}`, { cantidad: quantity });
+    } catch (error) {
+        console.error('❌ Error al actualizar cantidad:', error);
+    }
+    refreshCart();
 }
 
 // Actualizar contador del carrito
@@ -594,19 +156,18 @@ function updateCartCount() {
 // Actualizar modal del carrito
 function updateCartModal() {
     const cartItems = document.getElementById('cart-items');
-    const cartTotal = document.getElementById('cart-total');
+    const cartTotalElement = document.getElementById('cart-total');
     const checkoutBtn = document.getElementById('checkout-btn');
     
     console.log('🔄 Actualizando modal del carrito, productos:', cart);
     
-    if (!cartItems || !cartTotal) {
+    if (!cartItems || !cartTotalElement) {
         // Puede que no estemos en la página que tiene el modal
         console.warn('⚠️ Elementos del modal (cart-items o cart-total) no encontrados. Saltando actualización del modal.');
         return;
     }
     
     cartItems.innerHTML = '';
-    let total = 0;
     
     if (cart.length === 0) {
         cartItems.innerHTML = '<p class="empty-cart" style="text-align: center; color: #666; padding: 20px;">Tu carrito está vacío</p>';
@@ -616,18 +177,10 @@ function updateCartModal() {
         if (checkoutBtn) checkoutBtn.disabled = false;
         
         cart.forEach((item, index) => {
-            const itemTotal = item.price * item.quantity;
-            total += itemTotal;
-            
-            // Buscar la imagen del producto en la base de datos
-            const product = findProductById(item.id);
-            const productImageName = product ? product.image : PLACEHOLDER_IMAGE;
-            
             const cartItemElement = document.createElement('div');
             cartItemElement.className = 'cart-item';
             
-            // Reemplazo de {{ url_for(...) }} por getImagePath()
-            const imagePath = getImagePath(productImageName);
+            const imagePath = item.thumbnail || getImagePath(item.image || PLACEHOLDER_IMAGE);
             const placeholderPath = getImagePath(PLACEHOLDER_IMAGE);
 
             cartItemElement.innerHTML = `
@@ -655,20 +208,14 @@ function updateCartModal() {
         console.log('📦 Productos mostrados en el modal:', cart.length, 'productos');
     }
     
-    cartTotal.textContent = total.toFixed(2);
-    console.log('💰 Total calculado: $' + total.toFixed(2));
+    cartTotalElement.textContent = cartTotal.toFixed(2);
+    console.log('💰 Total del servidor: $' + cartTotal.toFixed(2));
 }
 
-// Función auxiliar para encontrar producto por ID
+// Función auxiliar para encontrar producto por ID (entre los ya descargados)
 function findProductById(id) {
     // Convertir el ID a número ya que los IDs en el carrito pueden ser strings
-    const productId = parseInt(id); 
-    for (const category in productsByCategory) {
-        // Usar triple igualdad (===) si se asegura que todos los IDs son números.
-        const product = productsByCategory[category].find(item => item.id === productId);
-        if (product) return product;
-    }
-    return null;
+    return productCache.get(parseInt(id)) || null;
 }
 
 // Función para mostrar notificaciones
@@ -712,8 +259,8 @@ function showNotification(message) {
 function initializeCart() {
     console.log('🚀 Inicializando sistema del carrito...');
     
-    // Cargar carrito desde localStorage
-    initializeCartFromStorage();
+    // Cargar carrito desde el servidor
+    loadCart().then(refreshCart);
     
     const cartIcon = document.getElementById('header-cart-icon');
     const cartSystem = document.getElementById('cart-system');
@@ -725,8 +272,7 @@ function initializeCart() {
     const cartElementsExist = cartIcon && cartSystem && closeCart && overlay;
 
     if (!cartElementsExist) {
-        console.warn('⚠️ No se encontraron todos los elementos del carrito (Icono, Modal, Cierre, Overlay). El sistema del carrito se inicializa parcialmente para el conteo y localStorage.');
-        updateCartCount(); // Asegurarse de que el contador se actualice si existe
+        console.warn('⚠️ No se encontraron todos los elementos del carrito (Icono, Modal, Cierre, Overlay). El sistema del carrito se inicializa parcialmente para el conteo.');
         return; // Salir si falta un elemento crítico para la interfaz del modal
     }
 
@@ -758,8 +304,6 @@ function initializeCart() {
             if (cart.length === 0) {
                 alert('Tu carrito está vacío. Añade algunos productos antes de proceder al pago.');
             } else {
-                const total = cart.reduce((sum, item) => sum + (item.price * item.quantity), 0);
-            
                 // Redirigir al formulario de compra
                 window.location.href = "/formulario_compra";
             
@@ -780,12 +324,25 @@ function initializeCart() {
 // ========== SISTEMA DE PRODUCTOS Y BÚSQUEDA ==========
 
 // Función para mostrar productos de una categoría
-function showCategory(category) {
+async function showCategory(category) {
     console.log('📋 Cambiando a categoría:', category);
     currentCategory = category;
-    const products = productsByCategory[category] || [];
-    displayProducts(products);
     updateActiveCategory(category);
+
+    let products = categoryCache.get(category);
+    if (!products) {
+        try {
+            products = await fetchProducts({ categoria: category, por_pagina: 100 });
+            categoryCache.set(category, products);
+        } catch (error) {
+            console.error('❌ Error cargando la categoría:', error);
+            products = [];
+        }
+    }
+    // Ignorar respuestas de una categoría que ya no está seleccionada
+    if (currentCategory === category) {
+        displayProducts(products);
+    }
 }
 
 // Función para mostrar productos
@@ -808,7 +365,8 @@ function displayProducts(products) {
         productCard.className = 'product-card';
         
         // Reemplazo de {{ url_for(...) }} por getImagePath()
-        const imagePath = getImagePath(product.image);
+        // Miniatura WebP del build de assets si existe; si no, la imagen original
+        const imagePath = product.thumbnail || getImagePath(product.image);
         const placeholderPath = getImagePath(PLACEHOLDER_IMAGE);
 
         // Escapar comillas en el nombre del producto para la función onclick
@@ -819,6 +377,7 @@ function displayProducts(products) {
                 <img src="${imagePath}" 
                     alt="${product.name}" 
                     class="product-image"
+                    loading="lazy"
                     onerror="this.src='${placeholderPath}'">
             </div>
             <div class="product-category">${product.category}</div>
@@ -856,8 +415,10 @@ function initializeSearch() {
         return;
     }
 
+    let searchTimer = null;
     searchInput.addEventListener('input', function(e) {
-        const query = e.target.value.toLowerCase().trim();
+        const query = e.target.value.trim();
+        clearTimeout(searchTimer);
         
         if (query.length === 0) {
             suggestionsList.style.display = 'none';
@@ -866,13 +427,17 @@ function initializeSearch() {
             return;
         }
 
-        const allProducts = getAllProducts();
-        const results = allProducts.filter(product => 
-            product.name.toLowerCase().includes(query) ||
-            product.category.toLowerCase().includes(query)
-        );
-
-        showSuggestions(results, query);
+        // Esperar a que el usuario deje de escribir antes de consultar al servidor
+        searchTimer = setTimeout(async () => {
+            try {
+                const results = await fetchProducts({ q: query, por_pagina: 5 });
+                if (searchInput.value.trim() === query) {
+                    showSuggestions(results, query);
+                }
+            } catch (error) {
+                console.error('❌ Error en la búsqueda:', error);
+            }
+        }, 150);
     });
 
     searchInput.addEventListener('keypress', function(e) {
@@ -890,17 +455,6 @@ function initializeSearch() {
     });
 }
 
-function getAllProducts() {
-    const allProducts = [];
-    for (const category in productsByCategory) {
-        // Asegurarse de que el valor sea un array antes de hacer spread
-        if (Array.isArray(productsByCategory[category])) {
-            allProducts.push(...productsByCategory[category]);
-        }
-    }
-    return allProducts;
-}
-
 function showSuggestions(products, query) {
     const suggestionsList = document.getElementById('suggestionsList');
     suggestionsList.innerHTML = '';
@@ -924,12 +478,13 @@ function showSuggestions(products, query) {
     suggestionsList.style.display = 'block';
 }
 
-function performSearch(query) {
-    const allProducts = getAllProducts();
-    const results = allProducts.filter(product => 
-        product.name.toLowerCase().includes(query.toLowerCase()) ||
-        product.category.toLowerCase().includes(query.toLowerCase())
-    );
+async function performSearch(query) {
+    let results = [];
+    try {
+        results = await fetchProducts({ q: query, por_pagina: 100 });
+    } catch (error) {
+        console.error('❌ Error en la búsqueda:', error);
+    }
     
     // Al buscar, desactiva la categoría activa visualmente
     document.querySelectorAll('.categories-list a').forEach(link => {
@@ -965,11 +520,18 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // Función para cargar el carrito en la tabla
         // Función para cargar el carrito en la tabla del checkout
-        function loadCheckoutCart() {
-            const cart = JSON.parse(localStorage.getItem('cart')) || [];
+        async function loadCheckoutCart() {
+            const cartItemsContainer = document.getElementById('checkout-cart-items');
+            const cartTotalElement = document.getElementById('checkout-cart-total');
+            if (!cartItemsContainer || !cartTotalElement) return;
+
+            await loadCart();
+            renderCheckoutCart();
+        }
+
+        function renderCheckoutCart() {
             const cartItemsContainer = document.getElementById('checkout-cart-items');
             const cartTotalElement = document.getElementById('checkout-cart-total');
-            let total = 0;
 
             cartItemsContainer.innerHTML = '';
 
@@ -977,9 +539,6 @@ document.addEventListener('DOMContentLoaded', function() {
                 cartItemsContainer.innerHTML = '<tr><td colspan="5" style="text-align: center; padding: 20px;">No hay productos en el carrito</td></tr>';
             } else {
                 cart.forEach((item, index) => {
-                    const subtotal = item.price * item.quantity;
-                    total += subtotal;
-
                     const row = document.createElement('tr');
                     row.innerHTML = `
                         <td>${item.name}</td>
@@ -989,7 +548,7 @@ document.addEventListener('DOMContentLoaded', function() {
                                 onchange="updateCartItemQuantity(${index}, this.value)" 
                                 style="width: 60px; padding: 5px; text-align: center;">
                         </td>
-                        <td>$${subtotal.toFixed(2)}</td>
+                        <td>$${item.subtotal.toFixed(2)}</td>
                         <td>
                             <button class="btn-remove" onclick="removeCartItem(${index})">Eliminar</button>
                         </td>
@@ -998,26 +557,26 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
             }
 
-            cartTotalElement.textContent = `$${total.toFixed(2)}`;
+            cartTotalElement.textContent = `$${cartTotal.toFixed(2)}`;
         }
 
         // Función para actualizar la cantidad de un producto en el carrito
-        function updateCartItemQuantity(index, newQuantity) {
-            const cart = JSON.parse(localStorage.getItem('cart')) || [];
+        async function updateCartItemQuantity(index, newQuantity) {
             if (index >= 0 && index < cart.length) {
-                cart[index].quantity = parseInt(newQuantity);
-                localStorage.setItem('cart', JSON.stringify(cart));
-                loadCheckoutCart(); // Recargar la tabla
+                try {
+                    await cartRequest('PUT', `/api/carrito/items/${cart[index].id}`, { cantidad: parseInt(newQuantity) || 0 });
+                } catch (error) {
+                    alert(error.message);
+                }
+                renderCheckoutCart(); // Recargar la tabla
             }
         }
 
         // Función para eliminar un producto del carrito
-        function removeCartItem(index) {
-            const cart = JSON.parse(localStorage.getItem('cart')) || [];
+        async function removeCartItem(index) {
             if (index >= 0 && index < cart.length) {
-                cart.splice(index, 1);
-                localStorage.setItem('cart', JSON.stringify(cart));
-                loadCheckoutCart(); // Recargar la tabla
+                await cartRequest('DELETE', `/api/carrito/items/${cart[index].id}`);
+                renderCheckoutCart(); // Recargar la tabla
             }
         }
 
@@ -1044,40 +603,19 @@ document.addEventListener('DOMContentLoaded', function() {
 
 
 
-        // Función para actualizar campos ocultos del formulario
-function updateHiddenFields() {
-    const cart = JSON.parse(localStorage.getItem('cart')) || [];
-    const cartDataField = document.getElementById('cart-data');
-    const totalAmountField = document.getElementById('total-amount');
-    
-    if (cartDataField && totalAmountField) {
-        cartDataField.value = JSON.stringify(cart);
-        const total = cart.reduce((sum, item) => sum + (item.price * item.quantity), 0);
-        totalAmountField.value = total.toFixed(2);
-        
-        console.log('📦 Datos del carrito preparados:', cart);
-        console.log('💰 Total calculado:', total.toFixed(2));
-    }
-}
-
-// Llamar esta función antes de enviar el formulario
+// El pedido se arma en el servidor con el carrito de la sesión: el formulario
+// solo envía los datos del cliente
 document.addEventListener('DOMContentLoaded', function() {
     const form = document.getElementById('purchase-form');
     if (form) {
         form.addEventListener('submit', function(e) {
-            updateHiddenFields(); // Actualizar campos antes de enviar
-            
-            const cart = JSON.parse(localStorage.getItem('cart')) || [];
             if (cart.length === 0) {
                 e.preventDefault();
                 alert('Tu carrito está vacío');
                 return;
             }
             
-            console.log('🔄 Enviando formulario con datos:', {
-                cart: cart,
-                total: document.getElementById('total-amount').value
-            });
+            console.log('🔄 Enviando formulario con', cart.length, 'productos');
         });
     }
 });
@@ -553,6 +553,42 @@ document.addEventListener('DOMContentLoaded', function() {
 
 
 
+// Detalle de pedidos en perfil.html: se descarga solo al expandir el pedido
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('.btn-order-detail').forEach(function(boton) {
+        const detalle = boton.nextElementSibling;
+        let cargado = false;
+
+        boton.addEventListener('click', async function() {
+            if (!cargado) {
+                try {
+                    const response = await fetch(boton.dataset.url);
+                    const data = await response.json();
+                    const items = data.items || [];
+                    detalle.innerHTML = '';
+                    items.forEach(function(item) {
+                        const li = document.createElement('li');
+                        li.textContent = `${item.nombre} x ${item.cantidad} - S/ ${item.precio.toFixed(2)}`;
+                        detalle.appendChild(li);
+                    });
+                    if (items.length === 0) {
+                        detalle.innerHTML = '<li>Sin detalle de productos</li>';
+                    }
+                    cargado = true;
+                } catch (error) {
+                    console.error('❌ Error cargando el detalle del pedido:', error);
+                    return;
+                }
+            }
+            detalle.classList.toggle('hidden');
+            boton.textContent = detalle.classList.contains('hidden') ? 'Ver detalle' : 'Ocultar detalle';
+        });
+    });
+});
+
+
+
 // ===== MANEJO DEL MODAL DE LOGIN =====
 // ===== MANEJO DEL MODAL DE LOGIN =====
 document.addEventListener('DOMContentLoaded', function() {
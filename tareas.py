@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RUTA_POR_DEFECTO = os.getenv("TAREAS_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cache", "tareas.sqlite3"
+)
+
+
+def parse_concurrencia(texto):
+    """"facturas=2,correos=1" -> {"facturas": 2, "correos": 1}"""
+    concurrencia = {}
+    for parte in (texto or "").split(","):
+        cola, _, hilos = parte.partition("=")
+        if cola.strip():
+            concurrencia[cola.strip()] = max(int(hilos or 1), 1)
+    return concurrencia
+
+
+class ColaTareas:
+    """Trabajo en segundo plano con una cola persistente en SQLite.
+
+    ``encolar`` guarda la tarea en disco y vuelve enseguida. Cada cola tiene
+    su propio grupo de hilos (``concurrencia``) que reclama tareas del
+    archivo, así varios workers de gunicorn se reparten el trabajo sin
+    repetirlo y lo pendiente sobrevive a un reinicio. Una tarea que falla se
+    reintenta con backoff exponencial hasta ``intentos_max``; después queda
+    como 'fallida' para revisarla a mano.
+    """
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO, concurrencia=None, intentos_max=5,
+                 backoff_base=5.0, backoff_max=600.0, intervalo=5.0, reclamo_expira=300.0):
+        self.ruta = ruta
+        self.concurrencia = dict(concurrencia or {})
+        self.intentos_max = intentos_max
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.intervalo = intervalo
+        self.reclamo_expira = reclamo_expira
+        self._funciones = {}  # nombre -> (cola, funcion)
+        self._reiniciar_tras_fork()
+        os.register_at_fork(after_in_child=self._reiniciar_tras_fork)
+
+    def _reiniciar_tras_fork(self):
+        # Hilos, locks y la conexión SQLite no se heredan entre procesos
+        self._lock = threading.Lock()
+        self._eventos = {}
+        self._hilos = []
+        self._detener = threading.Event()
+        self._sqlite = None
+
+    # ---------- API pública ----------
+    def registrar(self, nombre, funcion, cola="general"):
+        self._funciones[nombre] = (cola, funcion)
+        self.concurrencia.setdefault(cola, 1)
+
+    def encolar(self, nombre, *args, retraso=0):
+        """Guarda la tarea ``nombre(*args)``; los argumentos tienen que ser JSON."""
+        cola, _ = self._funciones[nombre]
+        ahora = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO tareas (cola, nombre, args, creado, disponible_en) VALUES (?, ?, ?, ?, ?)",
+                (cola, nombre, json.dumps(args), ahora, ahora + retraso),
+            )
+        self.iniciar()
+        evento = self._eventos.get(cola)
+        if evento is not None:
+            evento.set()
+
+    def iniciar(self):
+        """Arranca los hilos de cada cola en este proceso (idempotente)."""
+        if self._hilos:
+            return
+        with self._lock:
+            if self._hilos:
+                return
+            for cola, hilos in self.concurrencia.items():
+                self._eventos[cola] = evento = threading.Event()
+                for n in range(hilos):
+                    hilo = threading.Thread(
+                        target=self._trabajar, args=(cola, evento), name=f"tareas-{cola}-{n}", daemon=True
+                    )
+                    hilo.start()
+                    self._hilos.append(hilo)
+
+    def detener(self, timeout=10.0):
+        """Deja terminar las tareas en curso; las no empezadas quedan en el archivo."""
+        self._detener.set()
+        for evento in self._eventos.values():
+            evento.set()
+        limite = time.monotonic() + timeout
+        for hilo in self._hilos:
+            hilo.join(max(limite - time.monotonic(), 0))
+
+    def pendientes(self):
+        """{cola: tareas pendientes}"""
+        with self._lock:
+            filas = self._db().execute(
+                "SELECT cola, COUNT(*) FROM tareas WHERE estado = 'pendiente' GROUP BY cola"
+            ).fetchall()
+        return dict(filas)
+
+    def fallidas(self, limite=100):
+        with self._lock:
+            return self._db().execute(
+                "SELECT id, cola, nombre, args, intentos, error FROM tareas "
+                "WHERE estado = 'fallida' ORDER BY id DESC LIMIT ?", (limite,)
+            ).fetchall()
+
+    def ejecutar_pendientes(self, cola):
+        """Ejecuta en este hilo todo lo disponible de ``cola``; devuelve cuántas tareas corrió."""
+        ejecutadas = 0
+        while True:
+            tarea = self._reclamar(cola)
+            if tarea is None:
+                return ejecutadas
+            self._ejecutar(*tarea)
+            ejecutadas += 1
+
+    # ---------- Hilos ----------
+    def _trabajar(self, cola, evento):
+        while not self._detener.is_set():
+            try:
+                tarea = self._reclamar(cola)
+            except Exception:
+                logger.exception("Error leyendo la cola de tareas %s", cola)
+                tarea = None
+            if tarea is None:
+                evento.wait(self.intervalo)
+                evento.clear()
+                continue
+            self._ejecutar(*tarea)
+
+    def _ejecutar(self, tarea_id, cola, nombre, args, intentos):
+        _, funcion = self._funciones.get(nombre, (cola, None))
+        try:
+            if funcion is None:
+                raise LookupError(f"Tarea no registrada: {nombre}")
+            with metrics.timed("tarea", cola=cola, tarea=nombre):
+                funcion(*args)
+        except Exception as e:
+            intentos += 1
+            if intentos >= self.intentos_max:
+                logger.exception("Tarea %s %s%s falló %s veces: se abandona", tarea_id, nombre, tuple(args), intentos)
+                self._fallar(tarea_id, intentos, repr(e))
+                metrics.registry.inc("tareas_total", cola=cola, resultado="fallida")
+            else:
+                espera = min(self.backoff_max, self.backoff_base * 2 ** (intentos - 1))
+                logger.warning("Tarea %s %s falló (intento %s), reintento en %.0fs: %s", tarea_id, nombre, intentos, espera, e)
+                self._reprogramar(tarea_id, intentos, espera, repr(e))
+                metrics.registry.inc("tareas_total", cola=cola, resultado="reintento")
+            return
+        with self._lock:
+            self._db().execute("DELETE FROM tareas WHERE id = ?", (tarea_id,))
+        metrics.registry.inc("tareas_total", cola=cola, resultado="ok")
+
+    # ---------- SQLite ----------
+    def _db(self):
+        if self._sqlite is None:
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            db = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS tareas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cola TEXT NOT NULL,
+                    nombre TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    creado REAL NOT NULL,
+                    disponible_en REAL NOT NULL,
+                    reclamada_hasta REAL,
+                    error TEXT
+                )
+            ''')
+            db.execute("CREATE INDEX IF NOT EXISTS idx_tareas_cola ON tareas (cola, estado, disponible_en)")
+            self._sqlite = db
+        return self._sqlite
+
+    def _reclamar(self, cola):
+        ahora = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                fila = db.execute(
+                    "SELECT id, nombre, args, intentos FROM tareas "
+                    "WHERE cola = ? AND estado = 'pendiente' AND disponible_en <= ? "
+                    "AND (reclamada_hasta IS NULL OR reclamada_hasta < ?) "
+                    "ORDER BY disponible_en, id LIMIT 1",
+                    (cola, ahora, ahora),
+                ).fetchone()
+                if fila is not None:
+                    db.execute(
+                        "UPDATE tareas SET reclamada_hasta = ? WHERE id = ?",
+                        (ahora + self.reclamo_expira, fila[0]),
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        if fila is None:
+            return None
+        tarea_id, nombre, args, intentos = fila
+        return tarea_id, cola, nombre, json.loads(args), intentos
+
+    def _reprogramar(self, tarea_id, intentos, espera, error):
+        with self._lock:
+            self._db().execute(
+                "UPDATE tareas SET intentos = ?, disponible_en = ?, reclamada_hasta = NULL, error = ? WHERE id = ?",
+                (intentos, time.time() + espera, error, tarea_id),
+            )
+
+    def _fallar(self, tarea_id, intentos, error):
+        with self._lock:
+            self._db().execute(
+                "UPDATE tareas SET estado = 'fallida', intentos = ?, reclamada_hasta = NULL, error = ? WHERE id = ?",
+                (intentos, error, tarea_id),
+            )
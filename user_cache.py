@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class UserCache:
+    """Caché LRU con TTL de los campos de usuario que usa Flask-Login.
+
+    Guarda tuplas ``(id, email, telefono, puntos)``; cada petición construye
+    su propio ``User`` a partir de ellas.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # user_id -> (campos, expira_en)
+        self._invalidated = {}      # user_id -> instante (time.time) de la última invalidación
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            fields, expira_en = entry
+            if time.monotonic() >= expira_en:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return fields
+
+    def set(self, user_id, fields):
+        key = str(user_id)
+        with self._lock:
+            self._data[key] = (tuple(fields), time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            self._data.pop(key, None)
+            self._invalidated[key] = time.time()
+            # Las marcas más viejas que el TTL del snapshot ya no hacen falta
+            if len(self._invalidated) > self.maxsize:
+                limite = time.time() - self.ttl
+                self._invalidated = {k: v for k, v in self._invalidated.items() if v > limite}
+
+    def invalidated_after(self, user_id, instante):
+        """True si el usuario se invalidó después de ``instante`` (epoch)."""
+        with self._lock:
+            return self._invalidated.get(str(user_id), 0) >= instante
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._invalidated.clear()
+
+
+class UserSnapshot:
+    """Copia firmada de los campos del usuario guardada en una cookie."""
+
+    cookie_name = "user_snapshot"
+
+    def __init__(self, secret_key, max_age=300):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret_key, salt="user-snapshot")
+
+    def dumps(self, fields):
+        return self._serializer.dumps(list(fields))
+
+    def loads(self, value, user_id, cache):
+        """Devuelve los campos si la firma es válida, no caducó y no se invalidaron después."""
+        if not value:
+            return None
+        try:
+            fields, emitida = self._serializer.loads(value, max_age=self.max_age, return_timestamp=True)
+        except BadSignature:
+            return None
+        if not fields or str(fields[0]) != str(user_id):
+            return None
+        if cache.invalidated_after(user_id, emitida.timestamp()):
+            return None
+        return tuple(fields)
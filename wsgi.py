@@ -0,0 +1,10 @@
+"""Punto de entrada WSGI para producción.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Las migraciones no se ejecutan aquí: gunicorn.conf.py las corre una sola vez
+en el proceso maestro antes de crear los workers.
+"""
+from app import app
+
+application = app